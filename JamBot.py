@@ -1,6 +1,13 @@
+import time
+PROCESS_STARTED = time.monotonic()
+
 import discord
 from discord.ext import commands
+import asyncio
+import hashlib
+import json
 import logging
+import math
 import os
 from dotenv import load_dotenv
 
@@ -16,21 +23,101 @@ if not TOKEN:
     logger.error("DISCORD_TOKEN не найден в .env")
     exit(1)
 
+# Шардирование: launcher.py передаёт каждому процессу его диапазон шардов
+SHARD_IDS = [int(shard) for shard in os.getenv("SHARD_IDS", "").split(",") if shard.strip()]
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+HEALTH_FILE = os.getenv("HEALTH_FILE")
+HEALTH_INTERVAL = float(os.getenv("HEALTH_INTERVAL", "30"))
+
+# Хэш сигнатур команд после последней синхронизации дерева
+COMMAND_HASH_FILE = os.getenv("COMMAND_HASH_FILE", "command_tree.hash")
+
 # Настройка бота
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='/', intents=intents)
+if SHARD_COUNT:
+    bot = commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        shard_ids=SHARD_IDS or None,
+        shard_count=SHARD_COUNT,
+    )
+    logger.info(f"Шарды {SHARD_IDS or 'все'} из {SHARD_COUNT}")
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents)
+bot.process_started = PROCESS_STARTED
+
+def write_health():
+    latency = bot.latency
+    health = {
+        "pid": os.getpid(),
+        "shards": SHARD_IDS,
+        "guilds": len(bot.guilds),
+        "voice_clients": len(bot.voice_clients),
+        "latency_ms": round(latency * 1000) if math.isfinite(latency) else None,
+        "timestamp": time.time(),
+    }
+    tmp_file = HEALTH_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(health, f)
+    os.replace(tmp_file, HEALTH_FILE)
+
+async def report_health():
+    await bot.wait_until_ready()
+    while not bot.is_closed():
+        try:
+            await asyncio.to_thread(write_health)
+        except Exception as e:
+            logger.error(f"Ошибка записи состояния: {e}")
+        await asyncio.sleep(HEALTH_INTERVAL)
+
+def command_tree_hash():
+    payload = [command.to_dict(bot.tree) for command in bot.tree.get_commands()]
+    payload.sort(key=lambda command: command["name"])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+def read_command_hash():
+    try:
+        with open(COMMAND_HASH_FILE, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def write_command_hash(value):
+    with open(COMMAND_HASH_FILE, "w", encoding="utf-8") as f:
+        f.write(value)
+
+async def sync_command_tree():
+    # Глобальную синхронизацию выполняет только процесс с шардом 0
+    if SHARD_IDS and 0 not in SHARD_IDS:
+        return
+    current = command_tree_hash()
+    if current == await asyncio.to_thread(read_command_hash):
+        logger.info("Команды не изменились, синхронизация дерева пропущена")
+        return
+    synced = await bot.tree.sync()
+    await asyncio.to_thread(write_command_hash, current)
+    logger.info(f"Глобально синхронизировано {len(synced)} команд")
 
 @bot.event
-async def on_ready():
-    logger.info(f"Бот {bot.user} готов к работе!")
+async def setup_hook():
+    # setup_hook выполняется один раз после входа, в отличие от on_ready, который повторяется при переподключениях
     try:
-        bot.load_extension("commands")
+        await bot.load_extension("commands")
         logger.info("Модуль commands загружен")
-        synced = await bot.tree.sync()
-        logger.info(f"Глобально синхронизировано {len(synced)} команд")
+        await sync_command_tree()
     except Exception as e:
         logger.error(f"Ошибка загрузки модуля commands: {e}")
+    if HEALTH_FILE:
+        bot.loop.create_task(report_health())
+
+@bot.event
+async def on_ready():
+    if not getattr(bot, "ready_logged", False):
+        bot.ready_logged = True
+        logger.info(f"Бот {bot.user} готов к работе через {time.monotonic() - PROCESS_STARTED:.1f} с после запуска")
+    else:
+        logger.info(f"Бот {bot.user} переподключился")
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,239 @@
+import logging
+import os
+import threading
+import time
+import discord
+from metrics import FIRST_PACKET_SECONDS
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Режим воспроизведения: "opus" (FFmpeg отдаёт Opus, громкость — фильтром FFmpeg)
+# или "pcm" (прежний путь через FFmpegPCMAudio и PCMVolumeTransformer)
+AUDIO_MODE = os.getenv("AUDIO_MODE", "opus").lower()
+OPUS_BITRATE = int(os.getenv("OPUS_BITRATE", "128"))
+
+FFMPEG_BEFORE_OPTIONS = "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10"
+
+# Длительность одного кадра Discord в секундах
+FRAME_LENGTH = 0.02
+
+# Число живых источников (процессов FFmpeg воспроизведения)
+_live_lock = threading.Lock()
+_live_sources = 0
+
+def live_sources():
+    return _live_sources
+
+class TrackedSource(discord.AudioSource):
+    """
+    Обёртка над источником звука, которая считает отданные кадры,
+    чтобы знать текущую позицию в треке (нужна для /seek и /volume в режиме Opus).
+    on_first_frame вызывается из потока воспроизведения при первом кадре.
+    Заготовленный заранее источник (prewarmed) не попадает в FIRST_PACKET_SECONDS:
+    его первый кадр ждёт в буфере до перехода, и время ожидания не говорит о запуске FFmpeg.
+    """
+
+    def __init__(self, source, start=0.0, on_first_frame=None):
+        global _live_sources
+        self.source = source
+        self.start = start
+        self.frames = 0
+        self.created_at = time.monotonic()
+        self.on_first_frame = on_first_frame
+        self.prewarmed = False
+        self._closed = False
+        with _live_lock:
+            _live_sources += 1
+
+    @property
+    def position(self):
+        return self.start + self.frames * FRAME_LENGTH
+
+    @property
+    def volume(self):
+        return self.source.volume
+
+    @volume.setter
+    def volume(self, value):
+        self.source.volume = value
+
+    def read(self):
+        data = self.source.read()
+        if data:
+            if self.frames == 0:
+                if not self.prewarmed:
+                    FIRST_PACKET_SECONDS.observe(time.monotonic() - self.created_at)
+                if self.on_first_frame:
+                    self.on_first_frame()
+            self.frames += 1
+        return data
+
+    def is_opus(self):
+        return self.source.is_opus()
+
+    def cleanup(self):
+        global _live_sources
+        self.source.cleanup()
+        if not self._closed:
+            self._closed = True
+            with _live_lock:
+                _live_sources -= 1
+
+class GaplessSource(discord.AudioSource):
+    """
+    Источник для VoiceClient.play, который переходит на заранее запущенный следующий
+    источник в том же вызове read(), не останавливая плеер discord.py.
+    Когда позиция текущего трека достигает prewarm_at, из потока воспроизведения
+    вызывается on_prewarm(current); следующий источник передаётся через set_next.
+    При переходе вызывается on_switch(tag, silence), где silence — пауза в секундах
+    между последним кадром старого трека и первым кадром нового.
+    """
+
+    def __init__(self, current, prewarm_at=None, on_prewarm=None, on_switch=None):
+        self.current = current
+        self.prewarm_at = prewarm_at
+        self.on_prewarm = on_prewarm
+        self.on_switch = on_switch
+        self._next = None
+        self._lock = threading.Lock()
+        self._prewarm_requested = False
+        self._closed = False
+
+    @property
+    def position(self):
+        return self.current.position
+
+    @property
+    def closed(self):
+        return self._closed
+
+    @property
+    def pending(self):
+        pending = self._next
+        return pending[0] if pending else None
+
+    @property
+    def volume(self):
+        return self.current.volume
+
+    @volume.setter
+    def volume(self, value):
+        self.current.volume = value
+
+    def set_next(self, source, tag, prewarm_at, expected):
+        """
+        Назначает следующий источник, если текущий всё ещё expected и cleanup() ещё не вызван.
+        Returns:
+            bool: False, если трек уже сменился или воспроизведение закончено и source нужно закрыть.
+        """
+        with self._lock:
+            if self._closed or self.current is not expected or self._next is not None:
+                return False
+            source.prewarmed = True
+            self._next = (source, tag, prewarm_at)
+            return True
+
+    def clear_next(self):
+        # Очередь изменилась: заготовленный источник больше не следующий
+        with self._lock:
+            pending, self._next = self._next, None
+            self._prewarm_requested = False
+        if pending:
+            pending[0].cleanup()
+
+    def rearm(self):
+        # В очереди появился трек, которого не было при прошлой попытке подготовки
+        with self._lock:
+            if self._next is None:
+                self._prewarm_requested = False
+
+    def replace_current(self, source):
+        with self._lock:
+            old, self.current = self.current, source
+        old.cleanup()
+        self.clear_next()
+
+    def read(self):
+        while True:
+            source = self.current
+            data = source.read()
+            if data:
+                if (
+                    self.prewarm_at is not None and not self._prewarm_requested
+                    and source.position >= self.prewarm_at and self.on_prewarm
+                ):
+                    self._prewarm_requested = True
+                    self.on_prewarm(source)
+                return data
+            ended_at = time.monotonic()
+            with self._lock:
+                if self.current is not source:
+                    # /seek или /volume заменили источник во время чтения: пустой кадр старого — не конец трека
+                    continue
+                pending, self._next = self._next, None
+                if pending is None:
+                    return b""
+                self.current, tag, self.prewarm_at = pending
+                self._prewarm_requested = False
+            break
+        source.cleanup()
+        data = self.current.read()
+        if self.on_switch:
+            self.on_switch(tag, time.monotonic() - ended_at)
+        return data
+
+    def is_opus(self):
+        return self.current.is_opus()
+
+    def cleanup(self):
+        with self._lock:
+            self._closed = True
+        self.current.cleanup()
+        self.clear_next()
+
+def ffmpeg_process(source):
+    """
+    Возвращает subprocess.Popen процесса FFmpeg внутри источника (или None).
+    Args:
+        source (TrackedSource): Источник, созданный create_audio_source.
+    """
+    inner = getattr(source, "source", source)
+    # PCMVolumeTransformer хранит исходный FFmpegPCMAudio в original
+    inner = getattr(inner, "original", inner)
+    return getattr(inner, "_process", None)
+
+def create_audio_source(stream, volume=1.0, start=0, mode=None, on_first_frame=None):
+    """
+    Создаёт источник звука для VoiceClient.play.
+    В режиме Opus нативный Opus передаётся без перекодирования, если громкость 100%;
+    иначе FFmpeg применяет фильтр volume и сразу кодирует в Opus.
+    Args:
+        stream (dict): Информация о потоке (url, acodec, local).
+        volume (float): Громкость 0.0–1.0.
+        start (float): Позиция начала в секундах.
+        mode (str): "opus" или "pcm"; по умолчанию AUDIO_MODE.
+        on_first_frame (callable): Вызывается при первом отданном кадре.
+    Returns:
+        TrackedSource: Источник с учётом позиции.
+    """
+    mode = mode or AUDIO_MODE
+    # Параметры переподключения относятся к HTTP и не нужны для локального файла
+    before_options = "" if stream.get("local") else FFMPEG_BEFORE_OPTIONS
+    if start:
+        before_options = f"-ss {start} {before_options}".strip()
+    if mode == "pcm":
+        pcm = discord.FFmpegPCMAudio(stream["url"], before_options=before_options, options="-vn -bufsize 256k")
+        return TrackedSource(discord.PCMVolumeTransformer(pcm, volume=volume), start, on_first_frame)
+    if volume == 1.0 and stream.get("acodec") == "opus":
+        # discord.py передаёт кодек "opus" в FFmpeg как -c:a copy
+        codec = "opus"
+        options = "-vn"
+    else:
+        codec = None
+        options = f"-vn -af volume={volume:.2f}"
+    source = discord.FFmpegOpusAudio(
+        stream["url"], bitrate=OPUS_BITRATE, codec=codec, before_options=before_options, options=options
+    )
+    return TrackedSource(source, start, on_first_frame)
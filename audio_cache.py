@@ -0,0 +1,165 @@
+import asyncio
+import contextlib
+import json
+import logging
+import os
+from collections import OrderedDict
+from ffmpeg_supervisor import FFmpegLimitError
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AudioCache:
+    """
+    Локальный кэш аудио на диске с LRU-вытеснением по суммарному размеру.
+    Файлы хранятся как <video_id>.mka (звук копируется FFmpeg без перекодирования),
+    рядом лежит <video_id>.json с названием, длительностью и кодеком.
+    Args:
+        directory (str): Каталог кэша.
+        max_bytes (int): Бюджет на диске в байтах.
+        max_duration (float): Треки длиннее (в секундах) не кэшируются.
+        concurrency (int): Максимум одновременных загрузок.
+        supervisor (FFmpegSupervisor | None): Супервизор, в лимите процессов которого учитываются загрузки.
+    """
+
+    def __init__(self, directory, max_bytes, max_duration=3600, concurrency=2, supervisor=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_duration = max_duration
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.supervisor = supervisor
+        self._entries = OrderedDict()
+        self._pending = {}
+        self.total_bytes = 0
+
+    def _paths(self, vid):
+        base = os.path.join(self.directory, vid)
+        return base + ".mka", base + ".json"
+
+    def _scan(self):
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".part"):
+                os.remove(os.path.join(self.directory, name))
+                continue
+            if not name.endswith(".mka"):
+                continue
+            vid = name[:-4]
+            audio_path, meta_path = self._paths(vid)
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                stat = os.stat(audio_path)
+            except (OSError, ValueError):
+                continue
+            found.append((stat.st_atime, vid, stat.st_size, meta))
+        found.sort()
+        return found
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(None, self._scan)
+        for _, vid, size, meta in found:
+            self._entries[vid] = (size, meta)
+            self.total_bytes += size
+        logger.info(f"Аудиокэш: {len(self._entries)} файлов, {self.total_bytes // (1024 * 1024)} МБ")
+        await self._evict()
+
+    def get(self, vid):
+        """
+        Возвращает запись о потоке для локального файла или None.
+        """
+        entry = self._entries.get(vid) if vid else None
+        if entry is None:
+            return None
+        self._entries.move_to_end(vid)
+        meta = entry[1]
+        return {
+            "url": self._paths(vid)[0],
+            "title": meta.get("title") or "Неизвестный трек",
+            "duration": meta.get("duration"),
+            "acodec": meta.get("acodec"),
+            "headers": {},
+            "local": True,
+        }
+
+    def schedule_store(self, vid, stream):
+        if not vid or vid in self._entries or vid in self._pending or stream.get("local"):
+            return
+        duration = stream.get("duration")
+        if duration and duration > self.max_duration:
+            return
+        task = asyncio.get_running_loop().create_task(self._store(vid, stream))
+        self._pending[vid] = task
+        task.add_done_callback(lambda _: self._pending.pop(vid, None))
+
+    async def _store(self, vid, stream):
+        audio_path, meta_path = self._paths(vid)
+        part_path = audio_path + ".part"
+        async with self._semaphore:
+            try:
+                args = [
+                    "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+                    "-reconnect", "1", "-reconnect_streamed", "1", "-reconnect_delay_max", "10",
+                ]
+                for key, value in (stream.get("headers") or {}).items():
+                    if key.lower() == "user-agent":
+                        args += ["-user_agent", value]
+                args += ["-i", stream["url"], "-vn", "-c:a", "copy", "-f", "matroska", part_path]
+                with self.supervisor.download() if self.supervisor else contextlib.nullcontext():
+                    process = await asyncio.create_subprocess_exec(
+                        *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                    )
+                    _, stderr = await process.communicate()
+                if process.returncode != 0:
+                    logger.warning(f"Не удалось сохранить {vid} в аудиокэш: {stderr.decode(errors='ignore').strip()}")
+                    self._remove_files(part_path)
+                    return
+                meta = {"title": stream.get("title"), "duration": stream.get("duration"), "acodec": stream.get("acodec")}
+                loop = asyncio.get_running_loop()
+                size = await loop.run_in_executor(None, self._commit, part_path, audio_path, meta_path, meta)
+            except asyncio.CancelledError:
+                self._remove_files(part_path)
+                raise
+            except FFmpegLimitError as e:
+                # Трек сохранится при следующем воспроизведении, когда процессов станет меньше
+                logger.info(f"Загрузка {vid} в аудиокэш отложена: {e}")
+                return
+            except Exception as e:
+                logger.warning(f"Ошибка записи в аудиокэш {vid}: {e}")
+                self._remove_files(part_path)
+                return
+        self._entries[vid] = (size, meta)
+        self.total_bytes += size
+        logger.info(f"Сохранено в аудиокэш: {meta['title']} ({size // 1024} КБ)")
+        await self._evict()
+
+    def _commit(self, part_path, audio_path, meta_path, meta):
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(part_path, audio_path)
+        return os.path.getsize(audio_path)
+
+    def _remove_files(self, *paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def _evict(self):
+        removed = []
+        while self.total_bytes > self.max_bytes and self._entries:
+            vid, (size, _) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            removed.extend(self._paths(vid))
+        if removed:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._remove_files, *removed)
+            logger.info(f"Из аудиокэша удалено файлов: {len(removed) // 2}")
+
+    def close(self):
+        for task in list(self._pending.values()):
+            task.cancel()
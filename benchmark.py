@@ -0,0 +1,352 @@
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from urllib.parse import urlparse, parse_qs
+import discord
+from aiohttp import web
+import commands as music_commands
+from audio import TrackedSource
+from cookie_pool import CookiePool
+from extractor_pool import ExtractorPool
+from playlist_store import PlaylistStore
+from session_journal import SessionJournal
+from track_index import TrackIndex
+
+# Бенчмарк работает без Discord и YouTube: экстрактор, хост потоков и голосовой клиент подменены
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+class BenchConfig:
+    latency = 0.5
+    playlist_size = 200
+    frames_per_track = 50
+    frame_interval = 0.002
+    stream_port = 0
+    failing_identities = set()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+class StubYoutubeDL:
+    """
+    Заглушка YoutubeDL: задержка extract_info задаётся BenchConfig.latency,
+    URL с list= считаются плейлистами размера BenchConfig.playlist_size (кроме watch?v= с noplaylist).
+    Экземпляры аккаунтов из BenchConfig.failing_identities отвечают ошибкой входа.
+    """
+
+    calls = 0
+
+    def __init__(self, params):
+        self.params = dict(params)
+
+    def extract_info(self, url, download=False):
+        StubYoutubeDL.calls += 1
+        time.sleep(BenchConfig.latency)
+        if getattr(self, "cookie_identity", None) in BenchConfig.failing_identities:
+            raise Exception("Sign in to confirm you're not a bot")
+        query = parse_qs(urlparse(url).query)
+        # Как в yt-dlp: watch?v=…&list=… раскрывается в плейлист, если не задан noplaylist
+        if "list" in query and ("v" not in query or not self.params.get("noplaylist")):
+            start, end = 1, BenchConfig.playlist_size
+            items = self.params.get("playlist_items")
+            if items:
+                first, _, last = items.partition("-")
+                start, end = int(first), min(int(last or first), BenchConfig.playlist_size)
+            name = query["list"][0]
+            entries = [
+                {"url": f"https://www.youtube.com/watch?v={name}-{index}", "title": f"{name} #{index}"}
+                for index in range(start, end + 1)
+            ]
+            return {"title": name, "entries": entries}
+        vid = query.get("v", ["single"])[0]
+        stream_url = (
+            f"http://127.0.0.1:{BenchConfig.stream_port}/audio/{vid}?expire={int(time.time()) + 21600}"
+        )
+        return {
+            "url": stream_url,
+            "title": f"Трек {vid}",
+            "duration": BenchConfig.frames_per_track * 0.02,
+            "acodec": "opus",
+            "formats": [{"url": stream_url}],
+            "http_headers": {},
+        }
+
+class StubCookies:
+    """
+    Источник cookies одного аккаунта без файла и без фоновой генерации через браузер.
+    """
+
+    version = 0
+    valid = True
+    has_cookies = True
+
+    def __init__(self, path):
+        self.path = path
+
+    def cookies(self):
+        return ()
+
+    async def check(self):
+        return True
+
+    async def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+class FakeAudio(discord.AudioSource):
+    def __init__(self, frames, url=None):
+        self.remaining = frames
+        self.url = url
+
+    def read(self):
+        if self.remaining <= 0:
+            return b""
+        self.remaining -= 1
+        return b"\x00" * 3840
+
+    def is_opus(self):
+        return False
+
+def fake_audio_source(stream, volume=1.0, start=0, mode=None, on_first_frame=None):
+    frames = max(0, BenchConfig.frames_per_track - int(start / 0.02))
+    return TrackedSource(FakeAudio(frames, stream["url"]), start, on_first_frame)
+
+class FakeVoiceClient:
+    """
+    Голосовой клиент, который забирает кадры из источника с интервалом BenchConfig.frame_interval.
+    """
+
+    def __init__(self, channel, stats):
+        self.channel = channel
+        self.stats = stats
+        self.source = None
+        self._task = None
+        self._connected = True
+        self._paused = False
+        self.last_frame_at = None
+
+    def is_connected(self):
+        return self._connected
+
+    def is_playing(self):
+        return self._task is not None and not self._task.done() and not self._paused
+
+    def is_paused(self):
+        return self._paused
+
+    def play(self, source, after=None):
+        self.source = source
+        self._task = asyncio.get_running_loop().create_task(self._consume(after))
+
+    def _track_url(self):
+        # При бесшовном переходе GaplessSource меняет внутренний источник, не завершая воспроизведение
+        inner = getattr(self.source, "current", self.source)
+        return getattr(getattr(inner, "source", None), "url", None)
+
+    def _finish_track(self):
+        self.stats["tracks"] += 1
+        guild_tracks = self.stats["per_guild_tracks"]
+        guild_tracks[self.channel.guild_id] = guild_tracks.get(self.channel.guild_id, 0) + 1
+
+    async def _consume(self, after):
+        url = None
+        while True:
+            data = self.source.read()
+            if not data:
+                break
+            current_url = self._track_url()
+            if current_url != url:
+                if url is not None:
+                    self._finish_track()
+                if self.last_frame_at is not None:
+                    self.stats["gaps"].append(time.monotonic() - self.last_frame_at)
+                url = current_url
+            self.last_frame_at = time.monotonic()
+            self.stats["frames"] += 1
+            await asyncio.sleep(BenchConfig.frame_interval)
+        self.source.cleanup()
+        self._finish_track()
+        if after and self._connected:
+            after(None)
+
+    def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            if self.source:
+                self.source.cleanup()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def move_to(self, channel):
+        self.channel = channel
+
+    async def disconnect(self, force=False):
+        self._connected = False
+        self.stop()
+
+class FakeChannel:
+    def __init__(self, channel_id, guild_id, stats):
+        self.id = channel_id
+        self.guild_id = guild_id
+        self.stats = stats
+
+    async def connect(self, reconnect=True, timeout=5.0):
+        return FakeVoiceClient(self, self.stats)
+
+class FakeResponse:
+    async def defer(self, thinking=False):
+        pass
+
+    async def send_message(self, content):
+        pass
+
+class FakeFollowup:
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def send(self, content):
+        self.messages.append(content)
+
+class FakeInteraction:
+    def __init__(self, guild_id, channel, messages):
+        self.guild = type("Guild", (), {"id": guild_id})()
+        self.channel_id = 20_000 + guild_id
+        voice = type("VoiceState", (), {"channel": channel})()
+        self.user = type("Member", (), {"voice": voice})()
+        self.response = FakeResponse()
+        self.followup = FakeFollowup(messages)
+
+class FakeBot:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.user = type("User", (), {"id": 0})()
+        self.channels = {}
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+async def start_stream_server():
+    async def handle(request):
+        return web.Response(body=b"\x00" * 1024, content_type="audio/webm")
+
+    app = web.Application()
+    app.router.add_route("*", "/audio/{vid}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    BenchConfig.stream_port = site._server.sockets[0].getsockname()[1]
+    return runner
+
+async def run_guild(cog, bot, guild_id, stats, transitions):
+    channel = FakeChannel(10_000 + guild_id, guild_id, stats)
+    bot.channels[channel.id] = channel
+    messages = []
+    interaction = FakeInteraction(guild_id, channel, messages)
+    started = time.monotonic()
+    # Первая гильдия каждой десятки запускает плейлист, остальные — одиночные треки
+    if guild_id % 10 == 0:
+        await cog.play.callback(cog, interaction, f"https://www.youtube.com/playlist?list=PL{guild_id}")
+    else:
+        await cog.play.callback(cog, interaction, f"https://www.youtube.com/watch?v=g{guild_id}-0")
+        for index in range(1, transitions + 1):
+            await cog.queue.callback(cog, interaction, f"https://www.youtube.com/watch?v=g{guild_id}-{index}")
+    player = cog.players.get(guild_id)
+    if player and player.voice_client:
+        await cog.seek.callback(cog, interaction, 0)
+    deadline = started + 120
+    while time.monotonic() < deadline:
+        if stats["per_guild_tracks"].get(guild_id, 0) >= transitions + 1:
+            break
+        player = cog.players.get(guild_id)
+        if player is None or player.voice_client is None:
+            break
+        await asyncio.sleep(0.05)
+    return messages
+
+async def main(args):
+    BenchConfig.latency = args.latency
+    BenchConfig.playlist_size = args.playlist_size
+    BenchConfig.frames_per_track = args.frames
+    BenchConfig.frame_interval = args.frame_interval
+    BenchConfig.failing_identities = {f"stub-{index}" for index in range(args.failing_identities)}
+
+    stats = {"ttfa": [], "gaps": [], "frames": 0, "tracks": 0, "per_guild_tracks": {}}
+    runner = await start_stream_server()
+    workdir = tempfile.mkdtemp(prefix="jambot-bench-")
+    music_commands.create_audio_source = fake_audio_source
+    music_commands.TIME_TO_FIRST_AUDIO_SECONDS.observe = lambda value, **labels: stats["ttfa"].append(value)
+    bot = FakeBot()
+    cog = music_commands.Music(bot)
+    cog.cookies = CookiePool(
+        managers=[StubCookies(f"stub-{index}") for index in range(args.identities)],
+        rate_per_minute=args.cookie_rate, bench_base=args.bench_seconds,
+    )
+    cog.extractors = ExtractorPool(cookies=cog.cookies, factory=StubYoutubeDL)
+    cog.playlist_store = PlaylistStore(
+        path=os.path.join(workdir, "playlists.db"), page_size=music_commands.PLAYLIST_PAGE_SIZE, legacy_json=None
+    )
+    cog.track_index = TrackIndex(path=os.path.join(workdir, "track_index.db"))
+    cog.journal = SessionJournal(path=os.path.join(workdir, "sessions.journal"))
+    await cog.cog_load()
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    started = time.monotonic()
+    await asyncio.gather(*(run_guild(cog, bot, guild_id, stats, args.transitions) for guild_id in range(args.guilds)))
+    elapsed = time.monotonic() - started
+    current = tracemalloc.take_snapshot()
+    memory = sum(stat.size_diff for stat in current.compare_to(baseline, "filename"))
+    tracemalloc.stop()
+
+    print(f"Серверов: {args.guilds}, задержка экстрактора: {args.latency} с, плейлист: {args.playlist_size}")
+    print(f"Время: {elapsed:.2f} с, треков: {stats['tracks']}, кадров: {stats['frames']}")
+    print(f"Пропускная способность: {stats['tracks'] / elapsed:.1f} треков/с")
+    print(f"Вызовов extract_info: {StubYoutubeDL.calls}")
+    for name, values in (("До первого звука", stats["ttfa"]), ("Пауза между треками", stats["gaps"])):
+        if values:
+            print(
+                f"{name}: p50={statistics.median(values) * 1000:.0f} мс, "
+                f"p95={percentile(values, 0.95) * 1000:.0f} мс, p99={percentile(values, 0.99) * 1000:.0f} мс"
+            )
+    print(f"Память на сервер: {memory / max(args.guilds, 1) / 1024:.1f} КБ")
+    print(f"Извлечений без cookies из-за бюджета: {cog.cookies.over_budget}")
+    for status in cog.cookies.status():
+        print(
+            f"Аккаунт {status['name']}: запросов {status['requests']}, ошибок {status['errors']}, "
+            f"отстранён ещё на {status['benched']:.0f} с"
+        )
+
+    await cog.cog_unload()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк модуля Music")
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка extract_info, с")
+    parser.add_argument("--playlist-size", type=int, default=200)
+    parser.add_argument("--transitions", type=int, default=3, help="переходов между треками на сервер")
+    parser.add_argument("--frames", type=int, default=50, help="кадров в треке")
+    parser.add_argument("--frame-interval", type=float, default=0.002, help="интервал между кадрами, с")
+    parser.add_argument("--identities", type=int, default=2, help="аккаунтов в пуле cookies")
+    parser.add_argument("--failing-identities", type=int, default=0, help="из них отвечают ошибкой входа")
+    parser.add_argument("--cookie-rate", type=float, default=0, help="бюджет запросов аккаунта в минуту (0 — без ограничения)")
+    parser.add_argument("--bench-seconds", type=float, default=60, help="пауза отстранения аккаунта, с")
+    asyncio.run(main(parser.parse_args()))
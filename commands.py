@@ -1,16 +1,35 @@
 import discord
 from discord import app_commands
 from discord.ext import commands
-from yt_dlp import YoutubeDL
 import asyncio
 import functools
 import logging
-import json
 import os
 import time
 import shutil
 import aiohttp
-from cookies import generate_cookies_file, is_cookies_file_valid
+from cookie_pool import CookiePool
+from stream_cache import ProbeCache, StreamCache, stream_info_from
+from playlist_store import PlaylistStore, compact_playlist
+from prefetch import Prefetcher
+from extractor_pool import ExtractorPool
+from extraction_scheduler import ExtractionScheduler, INTERACTIVE, BACKGROUND
+from player import GuildPlayer, Track
+from audio import AUDIO_MODE, GaplessSource, create_audio_source, ffmpeg_process, live_sources
+from ffmpeg_supervisor import FFmpegLimitError, FFmpegSupervisor
+from loop_watchdog import LoopWatchdog
+from metrics import (
+    REGISTRY, EXTRACT_SECONDS, HEAD_CHECK_SECONDS, TIME_TO_FIRST_AUDIO_SECONDS, TRANSITION_SILENCE_SECONDS,
+    start_metrics_server,
+)
+from audio_cache import AudioCache
+from track_index import TrackIndex
+from failures import (
+    GLOBAL_ERRORS, CircuitBreaker, CircuitOpenError, NegativeCache, StreamUnavailableError, classify_error,
+)
+from session_journal import SessionJournal
+from singleflight import SingleFlight
+from urls import normalize_url, video_id
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -19,33 +38,641 @@ logger.info("Загружен commands.py версии 2025-06-13")
 
 # Диагностика FFmpeg
 logger.info(f"FFmpeg available: {shutil.which('ffmpeg')}")
+logger.info(f"Режим воспроизведения: {AUDIO_MODE}")
+
+# Размер кэша разрешённых ссылок на потоки
+STREAM_CACHE_SIZE = int(os.getenv("STREAM_CACHE_SIZE", "512"))
+
+# Кэш плейлистов: срок жизни записи (часы) и максимальное число плейлистов
+PLAYLIST_CACHE_TTL_HOURS = float(os.getenv("PLAYLIST_CACHE_TTL_HOURS", "168"))
+PLAYLIST_CACHE_MAX = int(os.getenv("PLAYLIST_CACHE_MAX", "1000"))
+
+# Плейлисты подгружаются страницами по PLAYLIST_PAGE_SIZE треков (YouTube отдаёт плейлист порциями по 100,
+# и yt-dlp перечитывает их с начала для каждой страницы), следующая страница запрашивается,
+# когда в очереди остаётся PLAYLIST_REFILL_AT треков
+PLAYLIST_PAGE_SIZE = int(os.getenv("PLAYLIST_PAGE_SIZE", "100"))
+PLAYLIST_REFILL_AT = int(os.getenv("PLAYLIST_REFILL_AT", "5"))
+
+# Предзагрузка очереди: глубина и число одновременных разрешений
+PREFETCH_DEPTH = int(os.getenv("PREFETCH_DEPTH", "2"))
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "4"))
+
+# HEAD-проверка потоков: срок кэша результата и возраст ссылки, при котором проверка не нужна (секунды),
+# а также лимит соединений общего HTTP-клиента и срок кэша DNS
+PROBE_CACHE_SECONDS = float(os.getenv("PROBE_CACHE_SECONDS", "60"))
+PROBE_FRESH_SECONDS = float(os.getenv("PROBE_FRESH_SECONDS", "30"))
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "100"))
+HTTP_DNS_CACHE_SECONDS = int(os.getenv("HTTP_DNS_CACHE_SECONDS", "300"))
+
+# Пул извлечения: число потоков и таймаут одного вызова (секунды)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "4"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "45"))
+
+# Локальный аудиокэш: каталог (пусто — отключён), бюджет в МБ и максимальная длительность трека
+AUDIO_CACHE_DIR = os.getenv("AUDIO_CACHE_DIR", "")
+AUDIO_CACHE_MB = int(os.getenv("AUDIO_CACHE_MB", "2048"))
+AUDIO_CACHE_MAX_DURATION = float(os.getenv("AUDIO_CACHE_MAX_DURATION", "3600"))
+
+# Порт HTTP-эндпоинта метрик Prometheus на 127.0.0.1 (пусто — отключён);
+# launcher.py передаёт процессу N порт METRICS_PORT + N
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+
+# Сторож цикла событий (включается LOOP_WATCHDOG=1): порог задержки и файл журнала зависаний
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "") == "1"
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", "250"))
+LOOP_LAG_LOG = os.getenv("LOOP_LAG_LOG", "loop_lag.log")
+
+# Массовое добавление в очередь: максимум треков за одну команду
+# и число одновременных разрешений названий, длительностей и доступности
+QUEUE_BULK_MAX = int(os.getenv("QUEUE_BULK_MAX", "200"))
+QUEUE_RESOLVE_CONCURRENCY = int(os.getenv("QUEUE_RESOLVE_CONCURRENCY", "8"))
+
+# Индекс разрешённых треков для автодополнения: файл, лимит на сервер и период сброса на диск (секунды)
+TRACK_INDEX_PATH = os.getenv("TRACK_INDEX_PATH", "track_index.db")
+TRACK_INDEX_MAX = int(os.getenv("TRACK_INDEX_MAX", "500"))
+TRACK_INDEX_FLUSH_SECONDS = float(os.getenv("TRACK_INDEX_FLUSH_SECONDS", "60"))
+
+# За сколько секунд до конца трека запускается FFmpeg следующего (0 — без бесшовных переходов)
+PREWARM_SECONDS = float(os.getenv("PREWARM_SECONDS", "5"))
+
+# Переход к следующему треку: максимум неудач подряд, пауза между попытками (секунды),
+# срок отрицательного кэша (множитель) и параметры приостановки извлечения при глобальных ошибках
+ADVANCE_MAX_FAILURES = int(os.getenv("ADVANCE_MAX_FAILURES", "10"))
+ADVANCE_BACKOFF_BASE = float(os.getenv("ADVANCE_BACKOFF_BASE", "0.5"))
+ADVANCE_BACKOFF_MAX = float(os.getenv("ADVANCE_BACKOFF_MAX", "8"))
+NEGATIVE_CACHE_TTL_SCALE = float(os.getenv("NEGATIVE_CACHE_TTL_SCALE", "1"))
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_BASE_DELAY = float(os.getenv("BREAKER_BASE_DELAY", "30"))
+BREAKER_MAX_DELAY = float(os.getenv("BREAKER_MAX_DELAY", "900"))
+
+# Супервизор FFmpeg: лимит процессов на узел и на сервер, сколько секунд без кадров считается
+# зависанием, период проверки и через сколько секунд повторить переход, если лимит исчерпан
+FFMPEG_MAX_PROCESSES = int(os.getenv("FFMPEG_MAX_PROCESSES", "64"))
+FFMPEG_MAX_PER_GUILD = int(os.getenv("FFMPEG_MAX_PER_GUILD", "3"))
+FFMPEG_STALL_SECONDS = float(os.getenv("FFMPEG_STALL_SECONDS", "20"))
+FFMPEG_CHECK_SECONDS = float(os.getenv("FFMPEG_CHECK_SECONDS", "5"))
+FFMPEG_RETRY_SECONDS = float(os.getenv("FFMPEG_RETRY_SECONDS", "10"))
+
+# Пул аккаунтов cookies: файлы через запятую (пусто — cookies.txt и cookies-N.txt из текущего каталога),
+# бюджет запросов аккаунта в минуту (при исчерпании извлечение идёт без cookies; 0 — без ограничения), сколько глобальных ошибок подряд отстраняют аккаунт
+# и пауза отстранения (секунды, удваивается до максимума)
+COOKIE_FILES = [path.strip() for path in os.getenv("COOKIE_FILES", "").split(",") if path.strip()]
+COOKIE_RATE_PER_MINUTE = float(os.getenv("COOKIE_RATE_PER_MINUTE", "0"))
+COOKIE_FAILURE_THRESHOLD = int(os.getenv("COOKIE_FAILURE_THRESHOLD", "2"))
+COOKIE_BENCH_SECONDS = float(os.getenv("COOKIE_BENCH_SECONDS", "60"))
+COOKIE_BENCH_MAX_SECONDS = float(os.getenv("COOKIE_BENCH_MAX_SECONDS", "3600"))
+
+# Журнал сессий для восстановления после перезапуска (пусто — отключён): файл,
+# период сброса на диск и позиций треков (секунды), число одновременных переподключений
+SESSION_JOURNAL = os.getenv("SESSION_JOURNAL", "sessions.journal")
+JOURNAL_FLUSH_SECONDS = float(os.getenv("JOURNAL_FLUSH_SECONDS", "5"))
+RESTORE_CONCURRENCY = int(os.getenv("RESTORE_CONCURRENCY", "25"))
+
+# Через сколько секунд бездействия состояние сервера освобождается
+PLAYER_IDLE_TIMEOUT = float(os.getenv("PLAYER_IDLE_TIMEOUT", "600"))
 
 class Music(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.voice_clients = {}
-        self.current_tracks = {}
-        self.current_sources = {}
-        self.queue = {}
-        self.loop = {}
-        self.loop_queue = {}
-        self.volume = {}
-        self.voice_channel_ids = {}
-
-    def ensure_cookies(self):
-        if not is_cookies_file_valid():
-            logger.info("Генерация нового cookies.txt")
-            if generate_cookies_file():
-                logger.info("cookies.txt создан")
+        self.players = {}
+        self.idle_task = None
+        self.index_task = None
+        self.journal_task = None
+        self.metrics_runner = None
+        self.http = None
+        self.first_play_logged = False
+        self.startup_seconds = 0
+        self.watchdog = None
+        if LOOP_WATCHDOG:
+            self.watchdog = LoopWatchdog(threshold=LOOP_LAG_THRESHOLD_MS / 1000, log_file=LOOP_LAG_LOG or None)
+        self.stream_cache = StreamCache(max_size=STREAM_CACHE_SIZE)
+        self.ffmpeg = FFmpegSupervisor(
+            self.source_state, max_total=FFMPEG_MAX_PROCESSES, max_per_guild=FFMPEG_MAX_PER_GUILD,
+            stall_seconds=FFMPEG_STALL_SECONDS, interval=FFMPEG_CHECK_SECONDS,
+        )
+        self.probe_cache = ProbeCache(ttl=PROBE_CACHE_SECONDS)
+        self.flights = SingleFlight()
+        self.negative_cache = NegativeCache(ttl_scale=NEGATIVE_CACHE_TTL_SCALE)
+        self.breaker = CircuitBreaker(BREAKER_THRESHOLD, BREAKER_BASE_DELAY, BREAKER_MAX_DELAY)
+        self.cookies = CookiePool(
+            COOKIE_FILES or None, rate_per_minute=COOKIE_RATE_PER_MINUTE, failure_threshold=COOKIE_FAILURE_THRESHOLD,
+            bench_base=COOKIE_BENCH_SECONDS, bench_max=COOKIE_BENCH_MAX_SECONDS,
+        )
+        self.extractors = ExtractorPool(cookies=self.cookies)
+        self.extraction = ExtractionScheduler(max_workers=EXTRACT_WORKERS, timeout=EXTRACT_TIMEOUT)
+        self.playlist_store = PlaylistStore(
+            ttl=PLAYLIST_CACHE_TTL_HOURS * 3600, max_entries=PLAYLIST_CACHE_MAX, page_size=PLAYLIST_PAGE_SIZE
+        )
+        self.journal = SessionJournal(SESSION_JOURNAL) if SESSION_JOURNAL else None
+        self.track_index = TrackIndex(path=TRACK_INDEX_PATH, max_per_guild=TRACK_INDEX_MAX)
+        self.prefetcher = Prefetcher(self.prefetch_stream, depth=PREFETCH_DEPTH, concurrency=PREFETCH_CONCURRENCY)
+        self.audio_cache = None
+        if AUDIO_CACHE_DIR:
+            self.audio_cache = AudioCache(
+                AUDIO_CACHE_DIR, AUDIO_CACHE_MB * 1024 * 1024, max_duration=AUDIO_CACHE_MAX_DURATION,
+                supervisor=self.ffmpeg,
+            )
+        self.register_metrics()
+
+    def register_metrics(self):
+        REGISTRY.gauge(
+            "jambot_queue_depth", "Длина очереди сервера",
+            lambda: [({"guild": guild_id}, len(player.queue)) for guild_id, player in self.players.items()],
+        )
+        REGISTRY.gauge(
+            "jambot_voice_clients", "Активные голосовые подключения",
+            lambda: sum(1 for player in self.players.values() if player.voice_client and player.voice_client.is_connected()),
+        )
+        REGISTRY.gauge("jambot_extract_backlog", "Задачи извлечения в очереди", lambda: self.extraction.queue_depth)
+        REGISTRY.gauge("jambot_extract_running", "Выполняющиеся извлечения", lambda: self.extraction.running)
+        REGISTRY.gauge("jambot_ffmpeg_processes", "Живые процессы FFmpeg воспроизведения", live_sources)
+        REGISTRY.gauge("jambot_ffmpeg_supervised", "Процессы FFmpeg под надзором", lambda: len(self.ffmpeg))
+        REGISTRY.gauge("jambot_ffmpeg_downloads", "Процессы FFmpeg загрузки в аудиокэш", lambda: self.ffmpeg.downloads)
+        REGISTRY.gauge("jambot_ffmpeg_killed", "Процессы FFmpeg, завершённые супервизором", lambda: self.ffmpeg.killed)
+        REGISTRY.gauge(
+            "jambot_ffmpeg_cpu_percent", "CPU процессов FFmpeg сервера, % ядра",
+            lambda: [({"guild": guild_id}, cpu) for guild_id, (cpu, _) in self.ffmpeg.usage().items()],
+        )
+        REGISTRY.gauge(
+            "jambot_ffmpeg_rss_bytes", "Резидентная память процессов FFmpeg сервера",
+            lambda: [({"guild": guild_id}, rss) for guild_id, (_, rss) in self.ffmpeg.usage().items()],
+        )
+        REGISTRY.gauge(
+            "jambot_loop_lag_seconds", "Последняя измеренная задержка цикла событий",
+            lambda: self.watchdog.last_lag if self.watchdog else 0,
+        )
+        REGISTRY.gauge(
+            "jambot_startup_to_first_play_seconds", "От запуска процесса до первой принятой /play",
+            lambda: self.startup_seconds,
+        )
+        REGISTRY.gauge("jambot_stream_cache_entries", "Записи в кэше ссылок", lambda: len(self.stream_cache))
+        REGISTRY.gauge("jambot_stream_cache_hits", "Попадания в кэш ссылок", lambda: self.stream_cache.hits)
+        REGISTRY.gauge("jambot_stream_cache_misses", "Промахи кэша ссылок", lambda: self.stream_cache.misses)
+        REGISTRY.gauge("jambot_extract_coalesced", "Запросы, присоединённые к уже идущему извлечению", lambda: self.flights.coalesced)
+        REGISTRY.gauge("jambot_negative_cache_entries", "Недавно не сработавшие URL", lambda: len(self.negative_cache))
+        REGISTRY.gauge("jambot_extract_paused_seconds", "Оставшаяся пауза извлечения", lambda: self.breaker.retry_in)
+        REGISTRY.gauge("jambot_cookie_healthy", "Здоровые аккаунты cookies", lambda: self.cookies.healthy)
+        REGISTRY.gauge(
+            "jambot_cookie_over_budget", "Извлечения без cookies из-за исчерпанного бюджета аккаунтов",
+            lambda: self.cookies.over_budget,
+        )
+        REGISTRY.gauge(
+            "jambot_cookie_benched_seconds", "Оставшееся отстранение аккаунта cookies",
+            lambda: [({"identity": status["name"]}, status["benched"]) for status in self.cookies.status()],
+        )
+        REGISTRY.gauge(
+            "jambot_cookie_requests", "Извлечения с аккаунтом cookies",
+            lambda: [({"identity": status["name"]}, status["requests"]) for status in self.cookies.status()],
+        )
+        REGISTRY.gauge(
+            "jambot_cookie_errors", "Ошибки auth и rate_limit аккаунта cookies",
+            lambda: [({"identity": status["name"]}, status["errors"]) for status in self.cookies.status()],
+        )
+
+    async def cog_load(self):
+        self.idle_task = self.bot.loop.create_task(self.evict_idle_players())
+        # Один клиент на модуль: соединения с хостами потоков и DNS-ответы переиспользуются между треками
+        self.http = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT, ttl_dns_cache=HTTP_DNS_CACHE_SECONDS, keepalive_timeout=30
+            ),
+            timeout=aiohttp.ClientTimeout(total=5),
+        )
+        await self.cookies.start()
+        self.ffmpeg.start()
+        await self.track_index.load()
+        self.index_task = self.bot.loop.create_task(self.flush_track_index())
+        if self.journal is not None:
+            await self.journal.load()
+            self.journal_task = self.bot.loop.create_task(self.journal_sessions())
+            self.bot.loop.create_task(self.restore_sessions())
+        if self.watchdog is not None:
+            self.watchdog.start()
+        if self.audio_cache is not None:
+            await self.audio_cache.load()
+        if METRICS_PORT:
+            # Без метрик модуль работает: занятый порт не должен оставлять процесс без команд музыки
+            try:
+                self.metrics_runner = await start_metrics_server(int(METRICS_PORT))
+            except Exception as e:
+                logger.error(f"Ошибка запуска сервера метрик на порту {METRICS_PORT}: {e}")
+
+    async def cog_unload(self):
+        if self.idle_task:
+            self.idle_task.cancel()
+        if self.index_task:
+            self.index_task.cancel()
+        await self.track_index.flush()
+        self.track_index.close()
+        if self.journal_task:
+            self.journal_task.cancel()
+        if self.journal is not None:
+            await self.journal.flush()
+        if self.metrics_runner:
+            await self.metrics_runner.cleanup()
+        if self.watchdog is not None:
+            self.watchdog.stop()
+        self.cookies.stop()
+        self.ffmpeg.stop()
+        for guild_id, player in list(self.players.items()):
+            self.prefetcher.cancel(guild_id)
+            player.cancel_metadata()
+        self.extraction.shutdown()
+        if self.http is not None:
+            await self.http.close()
+        self.playlist_store.close()
+        if self.audio_cache is not None:
+            self.audio_cache.close()
+
+    def get_player(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            player = self.players[guild_id] = GuildPlayer(guild_id)
+        player.touch()
+        return player
+
+    async def teardown(self, guild_id):
+        player = self.players.pop(guild_id, None)
+        if self.journal is not None:
+            self.journal.remove(guild_id)
+        if player is None:
+            return
+        self.prefetcher.cancel(guild_id)
+        player.cancel_metadata()
+        if player.advance_retry:
+            player.advance_retry.cancel()
+        if player.playlist_refill:
+            player.playlist_refill.cancel()
+        vc = player.voice_client
+        if vc and vc.is_connected():
+            await vc.disconnect(force=True)
+        logger.info(f"Состояние сервера {guild_id} освобождено")
+
+    async def evict_idle_players(self):
+        while True:
+            await asyncio.sleep(60)
+            for guild_id, player in list(self.players.items()):
+                if player.is_active():
+                    player.touch()
+                elif player.idle_for() > PLAYER_IDLE_TIMEOUT:
+                    try:
+                        await self.teardown(guild_id)
+                    except Exception as e:
+                        logger.error(f"Ошибка при освобождении сервера {guild_id}: {e}")
+
+    async def flush_track_index(self):
+        while True:
+            await asyncio.sleep(TRACK_INDEX_FLUSH_SECONDS)
+            try:
+                await self.track_index.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи индекса треков: {e}")
+
+    def playback_position(self, player):
+        source = player.voice_client.source if player.voice_client else None
+        return getattr(source, "position", 0)
+
+    def persist(self, player):
+        if self.journal is not None:
+            self.journal.record(player.guild_id, player.snapshot(self.playback_position(player)))
+
+    async def journal_sessions(self):
+        while True:
+            await asyncio.sleep(JOURNAL_FLUSH_SECONDS)
+            try:
+                for guild_id, player in self.players.items():
+                    if player.current and player.is_active():
+                        self.journal.record_position(guild_id, self.playback_position(player))
+                await self.journal.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи журнала сессий: {e}")
+
+    async def restore_sessions(self):
+        await self.bot.wait_until_ready()
+        states = self.journal.states()
+        if not states:
+            return
+        started = time.monotonic()
+        semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+        async def restore(guild_id, state):
+            async with semaphore:
+                return await self.restore_session(guild_id, state)
+
+        results = await asyncio.gather(*(restore(guild_id, state) for guild_id, state in states.items()))
+        logger.info(
+            f"Восстановлено сессий: {sum(results)} из {len(states)} за {time.monotonic() - started:.1f} с"
+        )
+
+    async def restore_session(self, guild_id, state):
+        try:
+            # Сервер другого процесса (шарды разделены между процессами) не трогается:
+            # его запись удалять нельзя, иначе она пропадёт и при сжатии журнала
+            if self.bot.get_guild(guild_id) is None:
+                return False
+            channel = self.bot.get_channel(state.get("channel") or 0)
+            if channel is None or guild_id in self.players:
+                self.journal.remove(guild_id)
+                return False
+            # После перезагрузки модуля без перезапуска процесса голосовое подключение ещё живо
+            if channel.guild.voice_client is not None:
+                return False
+            player = self.get_player(guild_id)
+            player.restore(state)
+            player.voice_client = await channel.connect(reconnect=True, timeout=10.0)
+            if player.current:
+                try:
+                    await self.play_track_from_url(guild_id, player.current, start=state.get("position") or 0)
+                except Exception as e:
+                    logger.warning(f"Текущий трек сервера {guild_id} не восстановлен: {e}")
+                    player.current = None
+                    await self.after_track(guild_id)
+            else:
+                await self.after_track(guild_id)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка восстановления сессии сервера {guild_id}: {e}")
+            await self.teardown(guild_id)
+            return False
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        if member.id != self.bot.user.id:
+            return
+        player = self.players.get(member.guild.id)
+        if player is None:
+            return
+        if after.channel is None:
+            # Собственное отключение при переподключении из /play не должно освобождать плеер
+            if player.reconnecting:
+                return
+            await self.teardown(member.guild.id)
+        else:
+            player.voice_channel_id = after.channel.id
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        await self.teardown(guild.id)
+
+    def schedule_prefetch(self, guild_id):
+        player = self.players.get(guild_id)
+        if player is None:
+            return
+        self.prefetcher.schedule(guild_id, player.queue)
+        if player.playlist_cursor and len(player.queue) <= PLAYLIST_REFILL_AT and not player.playlist_refill:
+            task = self.bot.loop.create_task(self.refill_queue(player))
+            player.playlist_refill = task
+            task.add_done_callback(lambda _: setattr(player, "playlist_refill", None))
+
+    async def run_extraction(self, guild_id, func, kind, priority, key=None):
+        # При серии глобальных ошибок yt-dlp не вызывается, пока CircuitBreaker разомкнут
+        self.breaker.check()
+        try:
+            with EXTRACT_SECONDS.time(kind=kind):
+                info = await self.extraction.run(guild_id, func, priority=priority, key=key)
+        except Exception as e:
+            # Ошибку с аккаунтом cookies учитывает его отстранение в пуле; прерыватель считает
+            # только извлечения без cookies (аккаунтов нет или все отстранены)
+            if getattr(e, "cookie_identity", None) is None:
+                self.breaker.record_failure(classify_error(e))
+            raise
+        self.breaker.record_success()
+        return info
+
+    async def fetch_playlist_page(self, guild_id, url, start, priority=INTERACTIVE):
+        # Одновременные запросы одной страницы (например, ссылка разослана по серверам) извлекаются один раз
+        key = ("flat", url, start)
+        if priority == INTERACTIVE:
+            # Интерактивный запрос не должен ждать фоновую подгрузку той же страницы в конце очереди
+            self.extraction.promote(key)
+        return await self.flights.run(key, lambda: self.load_playlist_page(guild_id, url, start, priority, key))
+
+    async def load_playlist_page(self, guild_id, url, start, priority, key=None):
+        page = await self.playlist_store.get_page(url, start)
+        if page is not None:
+            return page
+        items = f"{start}-{start + PLAYLIST_PAGE_SIZE - 1}"
+        func = functools.partial(self.extractors.extract_info, url, flat=True, playlist_items=items)
+        info = await self.run_extraction(guild_id, func, "flat", priority, key)
+        if "entries" not in info:
+            return info
+        entries = list(info["entries"] or [])
+        page = compact_playlist({"entries": entries})
+        page["last"] = len(entries) < PLAYLIST_PAGE_SIZE
+        await self.playlist_store.put_page(url, start, page)
+        return page
+
+    async def refill_queue(self, player):
+        cursor = player.playlist_cursor
+        if not cursor:
+            return
+        try:
+            page = await self.fetch_playlist_page(player.guild_id, cursor["url"], cursor["next"], priority=BACKGROUND)
+        except Exception as e:
+            logger.error(f"Ошибка подгрузки плейлиста: {e}")
+            if player.playlist_cursor is cursor:
+                player.finish_playlist()
+            return
+        if player.playlist_cursor is not cursor:
+            return
+        entries = page.get("entries") or []
+        player.queue.extend(Track.from_entry(entry) for entry in entries)
+        cursor["next"] += PLAYLIST_PAGE_SIZE
+        if page.get("last") or not entries:
+            player.finish_playlist()
+        logger.info(f"Подгружено {len(entries)} треков плейлиста для сервера {player.guild_id}")
+        self.prefetcher.schedule(player.guild_id, player.queue)
+        self.invalidate_prewarm(player, appended=True)
+        self.persist(player)
+
+    async def collect_tracks(self, guild_id, urls):
+        """
+        Превращает список URL в треки: плейлисты раскрываются постранично через кэш плейлистов.
+        Returns:
+            tuple[list[Track], list[tuple[str, str]]]: Треки и пары (URL, причина) для ссылок, которые не удалось открыть.
+        """
+        tracks = []
+        failed = []
+        for url in urls:
+            if len(tracks) >= QUEUE_BULK_MAX:
+                break
+            # Ссылку на видео не нужно извлекать заранее: метаданные придут из фонового разрешения.
+            # Видео из плейлиста (watch?v=…&list=…) раскрывается постранично, как и сам плейлист
+            if video_id(url) and "list=" not in url:
+                tracks.append(Track(url))
+                continue
+            start = 1
+            try:
+                while len(tracks) < QUEUE_BULK_MAX:
+                    page = await self.fetch_playlist_page(guild_id, url, start)
+                    if "entries" not in page:
+                        tracks.append(Track(url))
+                        break
+                    entries = page["entries"] or []
+                    tracks.extend(Track.from_entry(entry) for entry in entries)
+                    if page.get("last") or not entries:
+                        break
+                    start += PLAYLIST_PAGE_SIZE
+            except Exception as e:
+                logger.error(f"Ошибка извлечения данных {url}: {e}")
+                failed.append((url, str(e)))
+        return tracks[:QUEUE_BULK_MAX], failed
+
+    async def enqueue(self, interaction, player, text):
+        urls = [normalize_url(url) for url in text.replace(",", " ").split()]
+        tracks, failed = await self.collect_tracks(player.guild_id, urls)
+        player.queue.extend(tracks)
+        self.schedule_prefetch(player.guild_id)
+        self.invalidate_prewarm(player, appended=True)
+        self.persist(player)
+        if tracks:
+            task = self.bot.loop.create_task(self.resolve_queued(interaction, player, tracks, failed))
+            player.metadata_tasks.add(task)
+            task.add_done_callback(player.metadata_tasks.discard)
+        if len(tracks) == 1:
+            await interaction.followup.send("Трек добавлен в очередь!")
+        elif tracks:
+            await interaction.followup.send(f"Добавлено треков в очередь: {len(tracks)}. Названия загружаются…")
+        elif failed:
+            await self.report_dead_tracks(interaction, failed)
+        else:
+            await interaction.followup.send("Плейлист пуст.")
+
+    async def resolve_queued(self, interaction, player, tracks, failed):
+        """
+        Разрешает названия, длительности и доступность добавленных треков с ограниченным параллелизмом.
+        Результат записывается в трек сразу по готовности; недоступные треки удаляются
+        из очереди и перечисляются одним сообщением в конце.
+        """
+        semaphore = asyncio.Semaphore(QUEUE_RESOLVE_CONCURRENCY)
+        dead = list(failed)
+
+        async def resolve(track):
+            if track.resolved:
+                return
+            try:
+                async with semaphore:
+                    stream = await self.resolve_stream(track.url, player.guild_id, priority=BACKGROUND)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                kind = "paused" if isinstance(e, CircuitOpenError) else classify_error(e)
+                if kind in ("paused", "timeout") or kind in GLOBAL_ERRORS:
+                    # Трек может быть исправен: он останется в очереди без метаданных
+                    return
+                self.negative_cache.put(track.url, kind, str(e))
+                dead.append((track.title if track.title != "Неизвестный трек" else track.url, str(e)))
+                was_next = bool(player.queue) and player.queue[0] is track
+                try:
+                    player.queue.remove(track)
+                except ValueError:
+                    pass
+                if was_next:
+                    self.invalidate_prewarm(player)
+                return
+            track.title = stream["title"]
+            track.duration = stream["duration"]
+            track.resolved = True
+
+        started = time.monotonic()
+        await asyncio.gather(*(resolve(track) for track in tracks))
+        if self.players.get(player.guild_id) is player:
+            self.persist(player)
+        logger.info(
+            f"Разрешено {len(tracks) - len(dead) + len(failed)} из {len(tracks)} треков "
+            f"для сервера {player.guild_id} за {time.monotonic() - started:.1f} с"
+        )
+        await self.report_dead_tracks(interaction, dead)
+
+    async def report_dead_tracks(self, interaction, dead):
+        if not dead:
+            return
+        lines = [f"Недоступно и пропущено: {len(dead)}"]
+        for name, reason in dead:
+            lines.append(f"• {name} — {reason.splitlines()[0][:100] if reason else 'ошибка'}")
+        message = "\n".join(lines)
+        if len(message) > 1900:
+            message = message[:1900] + "\n…"
+        try:
+            await interaction.followup.send(message)
+        except Exception as e:
+            logger.error(f"Ошибка отправки отчёта о недоступных треках: {e}")
+
+    def cached_audio(self, url):
+        if self.audio_cache is None:
+            return None
+        return self.audio_cache.get(video_id(url))
+
+    async def resolve_stream(self, url, guild_id=None, priority=INTERACTIVE):
+        stream = self.cached_audio(url)
+        if stream:
+            logger.info(f"Трек взят из аудиокэша: {stream['title']}")
+        else:
+            stream = self.stream_cache.get(url)
+            if stream:
+                logger.info(f"Поток взят из кэша: {url}")
             else:
-                logger.warning("Не удалось создать cookies.txt. Инструкции: https://github.com/vana138/discord-bot/")
+                key = ("full", video_id(url) or url)
+                if priority == INTERACTIVE:
+                    # /play того же трека, что уже ждёт фоновой предзагрузки, поднимает её в интерактивную очередь
+                    self.extraction.promote(key)
+                stream = await self.flights.run(key, lambda: self.extract_stream(url, guild_id, priority, key))
+        if guild_id is not None:
+            self.track_index.add(guild_id, url, stream["title"])
+        return stream
+
+    async def extract_stream(self, url, guild_id, priority, key=None):
+        func = functools.partial(self.extractors.extract_info, url, flat=False)
+        info = await self.run_extraction(guild_id, func, "full", priority, key)
+        stream = stream_info_from(info)
+        stream["resolved_at"] = time.monotonic()
+        self.stream_cache.put(url, stream)
+        return stream
+
+    async def probe_stream(self, stream):
+        # Ссылка, только что выданная yt-dlp, заведомо жива
+        if time.monotonic() - stream.get("resolved_at", 0) < PROBE_FRESH_SECONDS:
+            return 200
+        status = self.probe_cache.get(stream["url"])
+        if status is None:
+            status = await self.flights.run(("probe", stream["url"]), lambda: self.head_stream(stream))
+            self.probe_cache.put(stream["url"], status)
+        return status
+
+    def probe_failed(self, track, stream, status):
+        """
+        Сбрасывает кэши потока, не прошедшего HEAD-проверку. 429 здесь — то же ограничение YouTube,
+        что и при извлечении, поэтому оно учитывается прерывателем.
+        Returns:
+            StreamUnavailableError: Ошибка для вызывающего кода.
+        """
+        logger.error(f"URL недоступен, статус: {status}")
+        self.stream_cache.invalidate(track.url)
+        self.probe_cache.invalidate(stream["url"])
+        error = StreamUnavailableError(status)
+        self.breaker.record_failure(classify_error(error))
+        return error
+
+    async def head_stream(self, stream):
+        with HEAD_CHECK_SECONDS.time():
+            async with self.http.head(stream["url"], headers=stream["headers"]) as response:
+                return response.status
+
+    async def prefetch_stream(self, url, guild_id):
+        return await self.resolve_stream(url, guild_id, priority=BACKGROUND)
 
     @app_commands.command(name="refresh_cookies", description="Проверяет cookies.txt")
     async def refresh_cookies(self, interaction: discord.Interaction):
         try:
             await interaction.response.defer(thinking=True)
-            if is_cookies_file_valid():
-                await interaction.followup.send("cookies.txt действителен.")
+            if await self.cookies.check():
+                lines = []
+                for status in self.cookies.status():
+                    state = "действителен" if status["valid"] else "устарел"
+                    if status["benched"]:
+                        state += f", отстранён ещё на {status['benched']:.0f} с ({status['last_kind']})"
+                    lines.append(f"{status['name']}: {state}, запросов {status['requests']}, ошибок {status['errors']}")
+                await interaction.followup.send("\n".join(lines))
             else:
                 message = (
                     "cookies.txt отсутствует или устарел. Шаги:\n"
@@ -60,8 +687,40 @@ class Music(commands.Cog):
             logger.error(f"Ошибка в refresh_cookies: {e}")
             await interaction.followup.send("Ошибка при проверке cookies.")
 
+    @app_commands.command(name="debug_lag", description="Зависания цикла событий (только для владельца)")
+    async def debug_lag(self, interaction: discord.Interaction):
+        try:
+            if not await self.bot.is_owner(interaction.user):
+                await interaction.response.send_message("Команда доступна только владельцу бота.", ephemeral=True)
+                return
+            if self.watchdog is None:
+                await interaction.response.send_message("Сторож выключен. Установите LOOP_WATCHDOG=1.", ephemeral=True)
+                return
+            lines = [
+                f"Макс. задержка: {self.watchdog.max_lag * 1000:.0f} мс, "
+                f"текущая: {self.watchdog.last_lag * 1000:.0f} мс, зависаний: {len(self.watchdog.events)}"
+            ]
+            for event in reversed(self.watchdog.events):
+                stamp = time.strftime("%H:%M:%S", time.localtime(event["time"]))
+                # Последние кадры стека указывают на блокирующий код
+                stack = "".join(event["stack"].splitlines(keepends=True)[-6:])
+                lines.append(f"{stamp} — {event['duration'] * 1000:.0f} мс\n```{stack}```")
+            message = "\n".join(lines)
+            if len(message) > 1900:
+                message = message[:1900] + "\n…"
+            await interaction.response.send_message(message, ephemeral=True)
+        except Exception as e:
+            logger.error(f"Ошибка в debug_lag: {e}")
+            await interaction.response.send_message("Ошибка команды.", ephemeral=True)
+
     @app_commands.command(name="play", description="Воспроизводит музыку из URL")
     async def play(self, interaction: discord.Interaction, url: str):
+        requested_at = time.monotonic()
+        url = normalize_url(url)
+        if not self.first_play_logged and hasattr(self.bot, "process_started"):
+            self.first_play_logged = True
+            self.startup_seconds = requested_at - self.bot.process_started
+            logger.info(f"Первая команда /play принята через {self.startup_seconds:.1f} с после запуска")
         try:
             await interaction.response.defer(thinking=True)
             if not interaction.user.voice or not interaction.user.voice.channel:
@@ -69,235 +728,465 @@ class Music(commands.Cog):
                 return
 
             voice_channel = interaction.user.voice.channel
-            guild_id = interaction.guild.id
-            self.voice_channel_ids[guild_id] = voice_channel.id
+            player = self.get_player(interaction.guild.id)
+            player.voice_channel_id = voice_channel.id
+            player.text_channel_id = interaction.channel_id
 
-            if guild_id in self.voice_clients:
-                vc = self.voice_clients[guild_id]
-                if not vc.is_connected() or vc.channel != voice_channel:
+            vc = player.voice_client
+            if vc and vc.is_connected() and vc.channel != voice_channel:
+                await vc.move_to(voice_channel)
+            elif vc and not vc.is_connected():
+                player.reconnecting = True
+                try:
                     await vc.disconnect(force=True)
-                    del self.voice_clients[guild_id]
+                    player.voice_client = None
+                    player.voice_client = await voice_channel.connect(reconnect=True, timeout=5.0)
+                    player.volume = 1.0
+                finally:
+                    player.reconnecting = False
 
-            if guild_id not in self.voice_clients:
-                vc = await voice_channel.connect(reconnect=True, timeout=5.0)
-                self.voice_clients[guild_id] = vc
-                self.volume[guild_id] = 1.0
+            if not player.voice_client:
+                player.voice_client = await voice_channel.connect(reconnect=True, timeout=5.0)
+                player.volume = 1.0
 
-            if self.voice_clients[guild_id].is_playing():
-                self.queue.setdefault(guild_id, []).append({"url": url, "title": "Неизвестный трек"})
-                await interaction.followup.send("Трек добавлен в очередь!")
+            if player.voice_client.is_playing():
+                await self.enqueue(interaction, player, url)
                 return
 
-            await self.play_track(interaction, url)
+            await self.play_track(interaction, url, requested_at=requested_at)
         except Exception as e:
             logger.error(f"Ошибка в play: {e}")
             await interaction.followup.send(f"Ошибка подключения: {str(e)}")
 
-    async def play_track(self, interaction, url):
+    @play.autocomplete("url")
+    async def play_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.track_choices(interaction, current)
+
+    def track_choices(self, interaction, current):
+        if interaction.guild is None:
+            return []
+        # Значение варианта в Discord ограничено 100 символами
+        return [
+            app_commands.Choice(name=title[:100], value=url)
+            for title, url in self.track_index.search(interaction.guild.id, current)
+            if len(url) <= 100
+        ]
+
+    async def play_track(self, interaction, url, requested_at=None):
         guild_id = interaction.guild.id
-        vc = self.voice_clients.get(guild_id)
+        player = self.get_player(guild_id)
+        vc = player.voice_client
         if not vc or not vc.is_connected():
             await interaction.followup.send("Бот не подключен к голосовому каналу!")
             return
 
-        self.ensure_cookies()
-        ydl_opts = {
-            "format": "bestaudio/best",
-            "noplaylist": False,
-            "quiet": True,
-            "socket_timeout": 15,
-            "extract_flat": True,
-            "retries": 5,
-            "no_warnings": True,
-        }
-        if os.path.exists("cookies.txt"):
-            ydl_opts["cookiefile"] = "cookies.txt"
-
-        ydl = YoutubeDL(ydl_opts)
-        loop = asyncio.get_event_loop()
-
-        def load_cache(playlist_url):
-            cache_file = "playlist_cache.json"
-            if os.path.exists(cache_file):
-                with open(cache_file, "r") as f:
-                    cache = json.load(f)
-                return cache.get(playlist_url, None)
-            return None
-
-        def save_cache(playlist_url, tracks):
-            cache_file = "playlist_cache.json"
-            cache = {}
-            if os.path.exists(cache_file):
-                with open(cache_file, "r") as f:
-                    cache = json.load(f)
-            cache[playlist_url] = tracks
-            with open(cache_file, "w") as f:
-                json.dump(cache, f)
-
-        cached = load_cache(url)
-        if cached:
-            info = cached
+        cached_stream = self.cached_audio(url) or self.stream_cache.get(url)
+        if cached_stream:
+            logger.info(f"Поток взят из кэша: {url}")
+            info = {"url": cached_stream["url"], "title": cached_stream["title"]}
         else:
             try:
-                func = functools.partial(ydl.extract_info, url, download=False)
-                info = await loop.run_in_executor(None, func)
-                if "entries" in info:
-                    save_cache(url, info)
+                info = await self.fetch_playlist_page(guild_id, url, 1)
             except Exception as e:
                 logger.error(f"Ошибка извлечения данных: {e}")
                 error_msg = "Не удалось загрузить трек. Проверьте URL."
-                if "Sign in" in str(e):
+                if isinstance(e, CircuitOpenError):
+                    error_msg = f"YouTube временно ограничил запросы. Повторите через {e.retry_in:.0f} с."
+                elif "Sign in" in str(e):
                     error_msg += " Нужен cookies.txt. Используйте `/refresh_cookies`."
                 await interaction.followup.send(error_msg)
                 return
 
         if "entries" in info:
-            first_track = info["entries"][0]
-            ydl_opts_full = ydl_opts.copy()
-            ydl_opts_full["extract_flat"] = False
-            ydl_full = YoutubeDL(ydl_opts_full)
+            if not info["entries"]:
+                await interaction.followup.send("Плейлист пуст.")
+                return
+            track = Track.from_entry(info["entries"][0])
             try:
-                func_full = functools.partial(ydl_full.extract_info, first_track["url"], download=False)
-                first_track_info = await loop.run_in_executor(None, func_full)
-                source = first_track_info["url"]
-                title = first_track_info.get("title", "Неизвестный трек")
-                self.queue[guild_id] = [{"url": entry["url"], "title": entry.get("title", "Неизвестный трек")} for entry in info["entries"][1:]]
+                stream = await self.resolve_stream(track.url, guild_id)
+                player.queue.clear()
+                player.queue.extend(Track.from_entry(entry) for entry in info["entries"][1:])
+                player.playlist_cursor = None if info.get("last") else {"url": url, "next": 1 + PLAYLIST_PAGE_SIZE}
             except Exception as e:
                 logger.error(f"Ошибка извлечения первого трека: {e}")
                 await interaction.followup.send("Не удалось загрузить плейлист.")
                 return
         else:
-            ydl_opts_full = ydl_opts.copy()
-            ydl_opts_full["extract_flat"] = False
-            ydl_full = YoutubeDL(ydl_opts_full)
+            track = Track(url)
+            # Для одиночного видео плоское извлечение уже возвращает выбранный формат
+            if info.get("url") and info.get("formats"):
+                self.stream_cache.put(url, stream_info_from(info))
             try:
-                func_full = functools.partial(ydl_full.extract_info, url, download=False)
-                info_full = await loop.run_in_executor(None, func_full)
-                source = info_full["url"]
-                title = info_full.get("title", "Неизвестный трек")
+                stream = await self.resolve_stream(url, guild_id)
             except Exception as e:
                 logger.error(f"Ошибка извлечения трека: {e}")
                 await interaction.followup.send("Не удалось загрузить трек.")
                 return
+        source = stream["url"]
+        track.title = stream["title"]
+        track.duration = stream["duration"]
+        track.resolved = True
 
-        # Упрощённый блок проверки URL (около строки 239)
-        logger.info(f"Проверка URL: {source}")
-        try:  # Строка ~239
-            async with aiohttp.ClientSession() as session:
-                async with session.head(source, timeout=5) as response:
-                    if response.status != 200:
-                        logger.error(f"URL недоступен, статус: {response.status}")
+        # Локальный файл из аудиокэша проверять не нужно
+        if not stream.get("local"):
+            # Упрощённый блок проверки URL (около строки 239)
+            logger.info(f"Проверка URL: {source}")
+            try:  # Строка ~239
+                status = await self.probe_stream(stream)
+                if status != 200:
+                    error = self.probe_failed(track, stream, status)
+                    if classify_error(error) in GLOBAL_ERRORS:
+                        await interaction.followup.send(
+                            f"YouTube временно ограничил запросы. Повторите через {self.advance_delay():.0f} с."
+                        )
+                    else:
                         await interaction.followup.send("Трек недоступен. Попробуйте другой URL.")
-                        return
-        except Exception as e:
-            logger.error(f"Ошибка проверки URL: {e}")
-            await interaction.followup.send("Ошибка проверки URL.")
-            return
+                    return
+            except Exception as e:
+                logger.error(f"Ошибка проверки URL: {e}")
+                self.stream_cache.invalidate(track.url)
+                await interaction.followup.send("Ошибка проверки URL.")
+                return
 
-        self.current_tracks[guild_id] = title
-        self.current_sources[guild_id] = source
-        self.loop[guild_id] = False
+        player.current = track
+        player.current_stream = stream
+        player.loop = False
 
-        ffmpeg_options = {
-            "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10",
-            "options": "-vn -bufsize 256k"
-        }
-        vol = self.volume.get(guild_id, 1.0)
-        audio_source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(source, **ffmpeg_options), volume=vol)
+        on_first_frame = None
+        if requested_at is not None:
+            on_first_frame = lambda: TIME_TO_FIRST_AUDIO_SECONDS.observe(time.monotonic() - requested_at)
         try:
-            vc.play(audio_source, after=lambda e: self.bot.loop.create_task(self.after_track(guild_id)))
-            logger.info(f"Играет: {title}")
-            await interaction.followup.send(f"Играет: **{title}**")
+            audio_source = self.gapless_source(
+                guild_id, self.spawn_source(guild_id, stream, volume=player.volume, on_first_frame=on_first_frame), track
+            )
+            vc.play(audio_source, after=lambda e: self.track_finished(guild_id, e))
+            logger.info(f"Играет: {track.title}")
+            self.schedule_prefetch(guild_id)
+            self.schedule_audio_cache(track, stream)
+            self.persist(player)
+            await interaction.followup.send(f"Играет: **{track.title}**")
+        except FFmpegLimitError as e:
+            logger.warning(f"Запуск FFmpeg отклонён для сервера {guild_id}: {e}")
+            await interaction.followup.send("Сервер воспроизведения перегружен, попробуйте позже.")
         except Exception as e:
             logger.error(f"Ошибка воспроизведения: {e}")
             await interaction.followup.send("Ошибка воспроизведения.")
 
+    def schedule_audio_cache(self, track, stream):
+        if self.audio_cache is not None:
+            self.audio_cache.schedule_store(video_id(track.url), stream)
+
+    def replace_source(self, player, position):
+        vc = player.voice_client
+        old_source = vc.source
+        # Если трек уже сохранён локально, перемотка идёт по файлу
+        local = self.cached_audio(player.current.url) if player.current else None
+        if local:
+            player.current_stream = local
+        # Если старый источник ещё не отдал ни кадра, замер «до первого звука» переходит к новому
+        current = old_source.current if isinstance(old_source, GaplessSource) else old_source
+        on_first_frame = current.on_first_frame if current is not None and current.frames == 0 else None
+        # Подмена источника не вызывает after, поэтому очередь не сдвигается
+        source = self.spawn_source(
+            player.guild_id, player.current_stream, volume=player.volume, start=position, on_first_frame=on_first_frame
+        )
+        if isinstance(old_source, GaplessSource):
+            # Заготовленный следующий источник сбрасывается: он создан со старой громкостью
+            old_source.replace_current(source)
+            return
+        vc.source = self.gapless_source(player.guild_id, source, player.current)
+        if old_source:
+            old_source.cleanup()
+
+    def spawn_source(self, guild_id, stream, **kwargs):
+        # Каждый процесс FFmpeg проходит через супервизор: лимиты проверяются до запуска
+        self.ffmpeg.admit(guild_id)
+        source = create_audio_source(stream, **kwargs)
+        self.ffmpeg.register(guild_id, source, ffmpeg_process(source))
+        return source
+
+    def source_state(self, guild_id, source):
+        player = self.players.get(guild_id)
+        vc = player.voice_client if player else None
+        current = vc.source if vc else None
+        if isinstance(current, GaplessSource):
+            if current.pending is source:
+                return "pending"
+            current = current.current
+        if current is not source:
+            return None
+        return "paused" if vc.is_paused() else "playing"
+
+    def prewarm_point(self, track):
+        if PREWARM_SECONDS <= 0 or not track.duration:
+            return None
+        return max(track.duration - PREWARM_SECONDS, 0)
+
+    def gapless_source(self, guild_id, source, track):
+        loop = self.bot.loop
+        gapless = GaplessSource(source, prewarm_at=self.prewarm_point(track))
+        # Обратные вызовы приходят из потока воспроизведения discord.py
+        gapless.on_prewarm = lambda current: asyncio.run_coroutine_threadsafe(
+            self.prewarm_next(guild_id, gapless, current), loop
+        )
+        gapless.on_switch = lambda tag, silence: asyncio.run_coroutine_threadsafe(
+            self.gapless_switched(guild_id, tag, silence), loop
+        )
+        return gapless
+
+    def invalidate_prewarm(self, player, appended=False):
+        source = player.voice_client.source if player.voice_client else None
+        if isinstance(source, GaplessSource):
+            # Добавление в конец очереди не меняет уже подготовленный следующий трек
+            if appended:
+                source.rearm()
+            else:
+                source.clear_next()
+
+    async def prewarm_next(self, guild_id, gapless, expected):
+        try:
+            player = self.players.get(guild_id)
+            if (
+                player is None or player.voice_client is None
+                or player.voice_client.source is not gapless or gapless.closed
+            ):
+                return
+            # Следующий трек выбирается так же, как в after_track
+            repeat = player.loop or (player.loop_queue and not player.queue and not player.playlist_cursor)
+            if repeat and player.current and player.current_stream:
+                track, stream = player.current, player.current_stream
+            elif player.queue:
+                track = player.queue[0]
+                stream = await self.resolve_stream(track.url, guild_id)
+                status = 200 if stream.get("local") else await self.probe_stream(stream)
+                if status != 200:
+                    self.probe_failed(track, stream, status)
+                    return
+            else:
+                return
+            track.title = stream["title"]
+            track.duration = stream["duration"]
+            track.resolved = True
+            # Пока шло разрешение, трек мог закончиться или смениться: FFmpeg для него уже не нужен
+            if (
+                self.players.get(guild_id) is not player or player.voice_client is None
+                or player.voice_client.source is not gapless or gapless.closed or gapless.current is not expected
+            ):
+                return
+            source = self.spawn_source(guild_id, stream, volume=player.volume)
+            if gapless.set_next(source, (track, stream), self.prewarm_point(track), expected):
+                logger.info(f"Следующий трек подготовлен: {track.title}")
+            else:
+                source.cleanup()
+        except Exception as e:
+            # Обычный переход через after_track обработает ошибку сам
+            logger.warning(f"Не удалось подготовить следующий трек сервера {guild_id}: {e}")
+
+    async def gapless_switched(self, guild_id, tag, silence):
+        self.record_transition(guild_id, silence, "gapless")
+        player = self.players.get(guild_id)
+        if player is None:
+            return
+        track, stream = tag
+        player.touch()
+        if track is not player.current:
+            if player.loop_queue and player.current:
+                player.requeue(player.current)
+            if player.queue and player.queue[0] is track:
+                player.queue.popleft()
+            player.current = track
+        player.current_stream = stream
+        logger.info(f"Играет: {track.title}")
+        self.schedule_prefetch(guild_id)
+        self.schedule_audio_cache(track, stream)
+        self.persist(player)
+
+    def record_transition(self, guild_id, silence, mode):
+        TRANSITION_SILENCE_SECONDS.observe(silence, mode=mode)
+        logger.info(f"Пауза между треками на сервере {guild_id}: {silence * 1000:.0f} мс ({mode})")
+
+    def track_finished(self, guild_id, error):
+        # Вызывается из потока воспроизведения discord.py
+        player = self.players.get(guild_id)
+        if player is not None:
+            player.ended_at = time.monotonic()
+        if error:
+            logger.error(f"Ошибка воспроизведения на сервере {guild_id}: {error}")
+        asyncio.run_coroutine_threadsafe(self.after_track(guild_id), self.bot.loop)
+
     async def after_track(self, guild_id):
+        """
+        Переходит к следующему треку. Недоступные треки пропускаются в цикле с нарастающей
+        паузой между попытками; при глобальных ошибках (нужен вход, 429) переход откладывается
+        до закрытия CircuitBreaker. Пропущенное перечисляется в текстовом канале одним сообщением.
+        """
         try:
-            vc = self.voice_clients.get(guild_id)
-            if not vc or not vc.is_connected():
+            player = self.players.get(guild_id)
+            if player is None:
                 return
-            if self.loop.get(guild_id, False):
-                source = self.current_sources.get(guild_id)
-                if source:
-                    await self.play_track_from_url(guild_id, source)
-            elif self.queue.get(guild_id):
-                next_track = self.queue[guild_id].pop(0)
-                await self.play_track_from_url(guild_id, next_track["url"])
-            elif self.loop_queue.get(guild_id, False) and self.queue.get(guild_id):
-                first_url = self.queue[guild_id][0]["url"]
-                await self.play_track_from_url(guild_id, first_url)
+            vc = player.voice_client
+            if not vc or not vc.is_connected() or vc.is_playing():
+                return
+            player.touch()
+            failed = []
+            retry = None
+            finished, player.current = player.current, None
+            player.current_stream = None
+            while True:
+                if player.loop and finished is not None:
+                    track = finished
+                else:
+                    if player.loop_queue and finished is not None:
+                        player.requeue(finished)
+                    if not player.queue and player.playlist_cursor:
+                        await (player.playlist_refill or self.refill_queue(player))
+                    track = player.queue.popleft() if player.queue else None
+                finished = None
+                if track is None:
+                    self.persist(player)
+                    break
+
+                known = self.negative_cache.get(track.url)
+                if known:
+                    error = known[1]
+                else:
+                    try:
+                        await self.play_track_from_url(guild_id, track)
+                        break
+                    except CircuitOpenError as e:
+                        # Трек не виноват: он вернётся в начало очереди, когда извлечение возобновится
+                        player.queue.appendleft(track)
+                        retry = (e.retry_in, self.pause_reason())
+                        break
+                    except FFmpegLimitError as e:
+                        player.queue.appendleft(track)
+                        retry = (FFMPEG_RETRY_SECONDS, f"Сервер воспроизведения перегружен: {e}")
+                        break
+                    except Exception as e:
+                        kind = classify_error(e)
+                        if kind in GLOBAL_ERRORS:
+                            # 429 от HEAD-проверки или ошибка входа без cookies — тоже не вина трека
+                            player.queue.appendleft(track)
+                            retry = (self.advance_delay(), self.pause_reason())
+                            break
+                        logger.error(f"Ошибка запуска трека {track.url} ({kind}): {e}")
+                        self.negative_cache.put(track.url, kind, str(e))
+                        error = str(e)
+                failed.append((track.title if track.title != "Неизвестный трек" else track.url, error))
+                # Повтор трека, который не запускается, превратился бы в бесконечный цикл
+                player.loop = False
+                if len(failed) >= ADVANCE_MAX_FAILURES:
+                    logger.warning(f"Сервер {guild_id}: {len(failed)} неудач подряд, переход остановлен")
+                    self.persist(player)
+                    break
+                if not known:
+                    await asyncio.sleep(min(ADVANCE_BACKOFF_BASE * 2 ** (len(failed) - 1), ADVANCE_BACKOFF_MAX))
+                if self.players.get(guild_id) is not player or player.voice_client is None:
+                    return
+                # Пока шла пауза, трек мог запустить /play или повторный переход
+                if player.voice_client.is_playing() or player.current is not None:
+                    return
+
+            if retry is not None:
+                self.schedule_advance_retry(player, retry[0])
+            if failed or retry is not None:
+                await self.report_skipped(player, failed, retry)
         except Exception as e:
             logger.error(f"Ошибка в after_track: {e}")
 
-    async def play_track_from_url(self, guild_id, url):
+    def advance_delay(self):
+        # Пока прерыватель разомкнут, ждать нужно до его закрытия, иначе — максимальную паузу перехода
+        return self.breaker.retry_in or ADVANCE_BACKOFF_MAX
+
+    def pause_reason(self):
+        kind = "нужен вход (обновите cookies через `/refresh_cookies`)" if self.breaker.last_kind == "auth" else "слишком много запросов"
+        return f"YouTube ограничил извлечение: {kind}"
+
+    def schedule_advance_retry(self, player, delay):
+        async def retry():
+            await asyncio.sleep(delay)
+            player.advance_retry = None
+            await self.after_track(player.guild_id)
+
+        if player.advance_retry is None:
+            player.advance_retry = self.bot.loop.create_task(retry())
+
+    async def report_skipped(self, player, failed, retry=None):
+        lines = []
+        if failed:
+            lines.append(f"Пропущено недоступных треков: {len(failed)}")
+            for name, reason in failed:
+                lines.append(f"• {name} — {reason.splitlines()[0][:100] if reason else 'ошибка'}")
+        if retry is not None:
+            delay, reason = retry
+            lines.append(f"{reason}. Воспроизведение продолжится через {delay:.0f} с.")
+        message = "\n".join(lines)
+        if len(message) > 1900:
+            message = message[:1900] + "\n…"
+        channel = self.bot.get_channel(player.text_channel_id) if player.text_channel_id else None
+        if channel is None:
+            logger.warning(f"Сервер {player.guild_id}: {message}")
+            return
         try:
-            vc = self.voice_clients.get(guild_id)
-            if not vc or not vc.is_connected():
-                voice_channel_id = self.voice_channel_ids.get(guild_id)
-                if voice_channel_id:
-                    voice_channel = self.bot.get_channel(voice_channel_id)
-                    if voice_channel:
-                        vc = await voice_channel.connect(reconnect=True, timeout=5.0)
-                        self.voice_clients[guild_id] = vc
-                    else:
-                        return
+            await channel.send(message)
+        except Exception as e:
+            logger.error(f"Ошибка отправки отчёта о пропущенных треках: {e}")
 
-            self.ensure_cookies()
-            ydl_opts = {
-                "format": "bestaudio/best",
-                "quiet": True,
-                "socket_timeout": 15,
-                "retries": 5,
-                "no_warnings": True,
-            }
-            if os.path.exists("cookies.txt"):
-                ydl_opts["cookiefile"] = "cookies.txt"
-            ydl = YoutubeDL(ydl_opts)
-            loop = asyncio.get_event_loop()
-            try:
-                func = functools.partial(ydl.extract_info, url, download=False)
-                info = await loop.run_in_executor(None, func)
-                source = info["url"]
-                title = info.get("title", "Неизвестный трек")
-            except Exception as e:
-                logger.error(f"Ошибка извлечения трека: {e}")
-                await self.after_track(guild_id)
+    async def play_track_from_url(self, guild_id, track, start=0):
+        """
+        Разрешает, проверяет и запускает трек. Ошибки извлечения и проверки пробрасываются вызывающему.
+        """
+        player = self.players.get(guild_id)
+        if player is None:
+            return
+        vc = player.voice_client
+        if not vc or not vc.is_connected():
+            voice_channel = self.bot.get_channel(player.voice_channel_id) if player.voice_channel_id else None
+            if voice_channel is None:
                 return
+            vc = await voice_channel.connect(reconnect=True, timeout=5.0)
+            player.voice_client = vc
+
+        stream = await self.resolve_stream(track.url, guild_id)
+        track.title = stream["title"]
+        track.duration = stream["duration"]
+        track.resolved = True
 
+        if not stream.get("local"):
             try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.head(source, timeout=5) as response:
-                        if response.status != 200:
-                            logger.error(f"URL недоступен, статус: {response.status}")
-                            await self.after_track(guild_id)
-                            return
-            except Exception as e:
-                logger.error(f"Ошибка проверки URL: {e}")
-                await self.after_track(guild_id)
-                return
+                status = await self.probe_stream(stream)
+            except Exception:
+                self.stream_cache.invalidate(track.url)
+                raise
+            if status != 200:
+                raise self.probe_failed(track, stream, status)
 
-            self.current_tracks[guild_id] = title
-            self.current_sources[guild_id] = source
-            ffmpeg_options = {
-                "before_options": "-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10",
-                "options": "-vn -bufsize 256k"
-            }
-            vol = self.volume.get(guild_id, 1.0)
-            audio_source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(source, **ffmpeg_options), volume=vol)
+        player.current = track
+        player.current_stream = stream
+        on_first_frame = None
+        ended_at, player.ended_at = player.ended_at, None
+        if ended_at is not None:
+            on_first_frame = lambda: self.record_transition(guild_id, time.monotonic() - ended_at, "restart")
+        audio_source = self.spawn_source(guild_id, stream, volume=player.volume, start=start, on_first_frame=on_first_frame)
+        if vc.is_playing() and isinstance(vc.source, GaplessSource):
+            # Плеер уже идёт: источник меняется между кадрами, без остановки и паузы
+            vc.source.replace_current(audio_source)
+            vc.source.prewarm_at = self.prewarm_point(track)
+        else:
             if vc.is_playing():
                 vc.stop()
-                await asyncio.sleep(0.5)
-            vc.play(audio_source, after=lambda e: self.bot.loop.create_task(self.after_track(guild_id)))
-            logger.info(f"Играет: {title}")
-        except Exception as e:
-            logger.error(f"Ошибка в play_track_from_url: {e}")
+            vc.play(self.gapless_source(guild_id, audio_source, track), after=lambda e: self.track_finished(guild_id, e))
+        logger.info(f"Играет: {track.title}")
+        self.schedule_prefetch(guild_id)
+        self.schedule_audio_cache(track, stream)
+        self.persist(player)
 
     @app_commands.command(name="nowplaying", description="Показывает текущий трек")
     async def nowplaying(self, interaction: discord.Interaction):
         try:
-            title = self.current_tracks.get(interaction.guild.id, None)
-            await interaction.response.send_message(f"Играет: **{title}**" if title else "Ничего не играет.")
+            player = self.players.get(interaction.guild.id)
+            track = player.current if player else None
+            await interaction.response.send_message(f"Играет: **{track.title}**" if track else "Ничего не играет.")
         except Exception as e:
             logger.error(f"Ошибка в nowplaying: {e}")
             await interaction.response.send_message("Ошибка команды.")
@@ -305,10 +1194,12 @@ class Music(commands.Cog):
     @app_commands.command(name="pause", description="Ставит музыку на паузу")
     async def pause(self, interaction: discord.Interaction):
         try:
-            if interaction.guild.id in self.voice_clients:
-                vc = self.voice_clients[interaction.guild.id]
+            player = self.players.get(interaction.guild.id)
+            if player and player.voice_client:
+                vc = player.voice_client
                 if vc.is_playing():
                     vc.pause()
+                    player.touch()
                     await interaction.response.send_message("Музыка на паузе.")
                 else:
                     await interaction.response.send_message("Музыка не играет.")
@@ -321,11 +1212,13 @@ class Music(commands.Cog):
     @app_commands.command(name="resume", description="Возобновляет музыку")
     async def resume(self, interaction: discord.Interaction):
         try:
-            if interaction.guild.id in self.voice_clients:
-                vc = self.voice_clients[interaction.guild.id]
+            player = self.players.get(interaction.guild.id)
+            if player and player.voice_client:
+                vc = player.voice_client
                 if vc.is_paused():
                     vc.resume()
-                    title = self.current_tracks.get(interaction.guild.id, "Неизвестный трек")
+                    player.touch()
+                    title = player.current.title if player.current else "Неизвестный трек"
                     await interaction.response.send_message(f"Возобновлено: **{title}**")
                 else:
                     await interaction.response.send_message("Музыка не на паузе.")
@@ -338,12 +1231,9 @@ class Music(commands.Cog):
     @app_commands.command(name="stop", description="Останавливает и отключает бота")
     async def stop(self, interaction: discord.Interaction):
         try:
-            if interaction.guild.id in self.voice_clients:
-                vc = self.voice_clients[interaction.guild.id]
-                await vc.disconnect(force=True)
-                del self.voice_clients[interaction.guild.id]
-                self.current_tracks.pop(interaction.guild.id, None)
-                self.current_sources.pop(interaction.guild.id, None)
+            player = self.players.get(interaction.guild.id)
+            if player and player.voice_client:
+                await self.teardown(interaction.guild.id)
                 await interaction.response.send_message("Бот отключен.")
             else:
                 await interaction.response.send_message("Бот не в голосовом канале.")
@@ -354,8 +1244,9 @@ class Music(commands.Cog):
     @app_commands.command(name="skip", description="Пропускает трек")
     async def skip(self, interaction: discord.Interaction):
         try:
-            if interaction.guild.id in self.voice_clients:
-                vc = self.voice_clients[interaction.guild.id]
+            player = self.players.get(interaction.guild.id)
+            if player and player.voice_client:
+                vc = player.voice_client
                 if vc.is_playing():
                     vc.stop()
                     await interaction.response.send_message("Трек пропущен.")
@@ -370,21 +1261,16 @@ class Music(commands.Cog):
     @app_commands.command(name="seek", description="Перематывает трек (в секундах)")
     async def seek(self, interaction: discord.Interaction, seconds: int):
         try:
-            if interaction.guild.id in self.voice_clients:
-                vc = self.voice_clients[interaction.guild.id]
+            guild_id = interaction.guild.id
+            player = self.players.get(guild_id)
+            if player and player.voice_client:
+                vc = player.voice_client
                 if vc.is_playing() or vc.is_paused():
-                    source = self.current_sources.get(interaction.guild.id)
-                    if not source:
+                    if not player.current_stream:
                         await interaction.response.send_message("Трек не найден!")
                         return
-                    vc.stop()
-                    ffmpeg_options = {
-                        "before_options": f"-ss {seconds} -reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 10",
-                        "options": "-vn -bufsize 256k"
-                    }
-                    vol = self.volume.get(interaction.guild.id, 1.0)
-                    new_source = discord.PCMVolumeTransformer(discord.FFmpegPCMAudio(source, **ffmpeg_options), volume=vol)
-                    vc.play(new_source, after=lambda e: self.bot.loop.create_task(self.after_track(interaction.guild.id)))
+                    self.replace_source(player, max(seconds, 0))
+                    self.persist(player)
                     await interaction.response.send_message(f"Перемотано на {seconds} сек.")
                 else:
                     await interaction.response.send_message("Ничего не играет.")
@@ -397,37 +1283,51 @@ class Music(commands.Cog):
     @app_commands.command(name="replay", description="Вкл/выкл повтор трека")
     async def replay(self, interaction: discord.Interaction):
         try:
-            guild_id = interaction.guild.id
-            self.loop[guild_id] = not self.loop.get(guild_id, False)
-            status = "включен" if self.loop[guild_id] else "выключен"
+            player = self.get_player(interaction.guild.id)
+            player.loop = not player.loop
+            self.invalidate_prewarm(player)
+            self.persist(player)
+            status = "включен" if player.loop else "выключен"
             await interaction.response.send_message(f"Повтор трека {status}.")
         except Exception as e:
             logger.error(f"Ошибка в replay: {e}")
             await interaction.response.send_message("Ошибка команды.")
 
-    @app_commands.command(name="queue", description="Добавляет трек или показывает очередь")
+    @app_commands.command(name="queue", description="Добавляет треки (несколько URL через пробел или плейлист) или показывает очередь")
     async def queue(self, interaction: discord.Interaction, url: str = None):
         try:
+            await interaction.response.defer(thinking=True)
             guild_id = interaction.guild.id
             if url:
-                self.queue.setdefault(guild_id, []).append({"url": url, "title": "Неизвестный трек"})
-                await interaction.response.send_message("Трек добавлен в очередь!")
-            elif guild_id in self.queue and self.queue[guild_id]:
-                queue_list = "\n".join([f"{i+1}. {track['title']}" for i, track in enumerate(self.queue[guild_id])])
-                await interaction.response.send_message(f"Очередь:\n{queue_list}")
+                player = self.get_player(guild_id)
+                player.text_channel_id = interaction.channel_id
+                await self.enqueue(interaction, player, url)
+            elif guild_id in self.players and self.players[guild_id].queue:
+                queue_list = "\n".join([f"{i+1}. {track.title}" for i, track in enumerate(self.players[guild_id].queue)])
+                if len(queue_list) > 1900:
+                    queue_list = queue_list[:1900] + "\n…"
+                await interaction.followup.send(f"Очередь:\n{queue_list}")
             else:
-                await interaction.response.send_message("Очередь пуста.")
+                await interaction.followup.send("Очередь пуста.")
         except Exception as e:
             logger.error(f"Ошибка в queue: {e}")
-            await interaction.response.send_message("Ошибка команды.")
+            await interaction.followup.send("Ошибка команды.")
+
+    @queue.autocomplete("url")
+    async def queue_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.track_choices(interaction, current)
 
     @app_commands.command(name="unqueue", description="Удаляет трек из очереди")
     async def unqueue(self, interaction: discord.Interaction, index: int):
         try:
-            guild_id = interaction.guild.id
-            if guild_id in self.queue and 0 <= index - 1 < len(self.queue[guild_id]):
-                removed_track = self.queue[guild_id].pop(index - 1)
-                await interaction.response.send_message(f"Удалён: {removed_track['title']}")
+            player = self.players.get(interaction.guild.id)
+            if player and 0 <= index - 1 < len(player.queue):
+                removed_track = player.queue[index - 1]
+                del player.queue[index - 1]
+                if index == 1:
+                    self.invalidate_prewarm(player)
+                self.persist(player)
+                await interaction.response.send_message(f"Удалён: {removed_track.title}")
             else:
                 await interaction.response.send_message("Неверный индекс или очередь пуста.")
         except Exception as e:
@@ -440,12 +1340,18 @@ class Music(commands.Cog):
             if not 0 <= vol <= 100:
                 await interaction.response.send_message("Громкость должна быть 0–100.")
                 return
-            guild_id = interaction.guild.id
-            self.volume[guild_id] = vol / 100.0
-            if guild_id in self.voice_clients and self.current_sources.get(guild_id):
-                vc = self.voice_clients[guild_id]
+            player = self.get_player(interaction.guild.id)
+            player.volume = vol / 100.0
+            if player.voice_client and player.current_stream:
+                vc = player.voice_client
                 if hasattr(vc.source, 'volume'):
                     vc.source.volume = vol / 100.0
+                    # Заготовленный следующий трек создан со старой громкостью
+                    self.invalidate_prewarm(player)
+                elif vc.source and (vc.is_playing() or vc.is_paused()):
+                    # В режиме Opus громкость задаётся фильтром FFmpeg, поэтому процесс перезапускается с текущей позиции
+                    self.replace_source(player, vc.source.position)
+            self.persist(player)
             await interaction.response.send_message(f"Громкость: {vol}%.")
         except Exception as e:
             logger.error(f"Ошибка в volume: {e}")
@@ -454,9 +1360,11 @@ class Music(commands.Cog):
     @app_commands.command(name="loopqueue", description="Вкл/выкл повтор очереди")
     async def loopqueue(self, interaction: discord.Interaction):
         try:
-            guild_id = interaction.guild.id
-            self.loop_queue[guild_id] = not self.loop_queue.get(guild_id, False)
-            status = "включен" if self.loop_queue[guild_id] else "выключен"
+            player = self.get_player(interaction.guild.id)
+            player.loop_queue = not player.loop_queue
+            self.invalidate_prewarm(player, appended=True)
+            self.persist(player)
+            status = "включен" if player.loop_queue else "выключен"
             await interaction.response.send_message(f"Повтор очереди {status}.")
         except Exception as e:
             logger.error(f"Ошибка в loopqueue: {e}")
@@ -466,7 +1374,14 @@ class Music(commands.Cog):
     async def clearqueue(self, interaction: discord.Interaction):
         try:
             guild_id = interaction.guild.id
-            self.queue[guild_id] = []
+            player = self.players.get(guild_id)
+            if player:
+                player.queue.clear()
+                player.playlist_cursor = None
+                player.cancel_metadata()
+                self.invalidate_prewarm(player)
+                self.persist(player)
+            self.prefetcher.cancel(guild_id)
             await interaction.response.send_message("Очередь очищена.")
         except Exception as e:
             logger.error(f"Ошибка в clearqueue: {e}")
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import os
+from http.cookiejar import LoadError, MozillaCookieJar
+from cookies import generate_cookies_file, is_cookies_file_valid
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CookieManager:
+    """
+    Держит cookies из cookies.txt в памяти и обновляет их в фоне.
+    Файл читается один раз и перечитывается только при изменении времени модификации;
+    проверка срока и генерация нового файла (browser_cookie3) выполняются в пуле потоков.
+    Args:
+        path (str): Путь к cookies.txt.
+        browser (str | None): Браузер для generate_cookies_file (None — файл только проверяется).
+        max_age_days (int): Максимальный возраст файла для is_cookies_file_valid.
+        check_interval (float): Период проверки срока действия, в секундах.
+        watch_interval (float): Период проверки изменения файла, в секундах.
+    """
+
+    def __init__(self, path="cookies.txt", browser="edge", max_age_days=30, check_interval=600, watch_interval=15):
+        self.path = path
+        self.browser = browser
+        self.max_age_days = max_age_days
+        self.check_interval = check_interval
+        self.watch_interval = watch_interval
+        self.version = 0
+        self.valid = False
+        self._cookies = ()
+        self._mtime = None
+        self._tasks = []
+
+    @property
+    def has_cookies(self):
+        return bool(self._cookies)
+
+    def cookies(self):
+        return self._cookies
+
+    def _mtime_sync(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def _load_sync(self):
+        mtime = self._mtime_sync()
+        if mtime is None:
+            return (), None
+        jar = MozillaCookieJar(self.path)
+        try:
+            jar.load(ignore_discard=True)
+        except (LoadError, OSError) as e:
+            logger.error(f"Ошибка чтения {self.path}: {e}")
+            return (), mtime
+        return tuple(jar), mtime
+
+    async def reload(self):
+        cookies, mtime = await asyncio.to_thread(self._load_sync)
+        self._cookies = cookies
+        self._mtime = mtime
+        self.version += 1
+        logger.info(f"Загружено cookies: {len(cookies)}")
+
+    async def check(self):
+        self.valid = await asyncio.to_thread(is_cookies_file_valid, self.path, self.max_age_days)
+        if self.valid:
+            return True
+        if not self.browser:
+            logger.warning(f"{self.path} отсутствует или устарел, обновите его через cookies.py")
+            return False
+        logger.info("Генерация нового cookies.txt")
+        if await asyncio.to_thread(generate_cookies_file, self.browser, self.path):
+            logger.info("cookies.txt создан")
+            await self.reload()
+            self.valid = True
+        else:
+            logger.warning("Не удалось создать cookies.txt. Инструкции: https://github.com/vana138/discord-bot/")
+        return self.valid
+
+    async def start(self):
+        await self.reload()
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._watch()), loop.create_task(self._check_periodically())]
+
+    def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                if await asyncio.to_thread(self._mtime_sync) != self._mtime:
+                    logger.info(f"{self.path} изменился, cookies перечитываются")
+                    await self.reload()
+            except Exception as e:
+                logger.error(f"Ошибка отслеживания {self.path}: {e}")
+
+    async def _check_periodically(self):
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error(f"Ошибка проверки cookies: {e}")
+            await asyncio.sleep(self.check_interval)
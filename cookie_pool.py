@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from cookie_manager import CookieManager
+from cookies import cookie_pool_files
+from failures import GLOBAL_ERRORS, classify_error
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CookieIdentity:
+    """
+    Один аккаунт пула: его cookies, бюджет запросов и состояние здоровья.
+    Бюджет — ведро токенов на rate_per_minute запросов в минуту; ошибки auth и rate_limit
+    подряд отправляют аккаунт «на скамейку», каждая следующая скамейка без успеха между ними вдвое дольше.
+    """
+
+    def __init__(self, manager, rate_per_minute):
+        self.manager = manager
+        self.name = os.path.basename(manager.path)
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, rate_per_minute / 6)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.failures = 0
+        self.benches = 0
+        self.benched_until = 0.0
+        self.benched_version = None
+        self.last_kind = None
+        self.requests = 0
+        self.errors = 0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def benched_for(self, now=None):
+        if self.benched_version is not None and self.manager.version != self.benched_version:
+            # Отстранение за auth снимается, как только файл cookies аккаунта перечитан
+            self.benched_until = 0.0
+            self.benched_version = None
+        return max(0.0, self.benched_until - (now if now is not None else time.monotonic()))
+
+class CookiePool:
+    """
+    Пул аккаунтов YouTube (по файлу cookies на аккаунт) для распределения извлечений.
+    acquire() выдаёт здоровый аккаунт с наибольшим запасом бюджета, а если бюджет исчерпан у всех —
+    не ждёт пополнения, и извлечение идёт без cookies; report() сообщает результат.
+    После failure_threshold глобальных ошибок подряд аккаунт отстраняется на bench_base секунд
+    (удваивается до bench_max), пока не отстранены все — тогда извлечение идёт без cookies.
+    Безопасен для вызова из пула потоков.
+    Args:
+        paths (list[str] | None): Файлы cookies; по умолчанию cookies.txt и cookies-N.txt из текущего каталога.
+        browser (str): Браузер для пересоздания первого файла (остальные обновляются вручную через cookies.py).
+        rate_per_minute (float): Бюджет запросов аккаунта в минуту (по умолчанию 0 — без ограничения).
+        failure_threshold (int): Сколько глобальных ошибок подряд отстраняют аккаунт.
+        bench_base (float): Первая пауза отстранения, в секундах.
+        bench_max (float): Максимальная пауза отстранения, в секундах.
+        managers (list | None): Готовые источники cookies вместо файлов (для тестов и бенчмарка).
+    """
+
+    def __init__(self, paths=None, browser="edge", rate_per_minute=0, failure_threshold=2,
+                 bench_base=60, bench_max=3600, managers=None):
+        if managers is None:
+            paths = list(paths or cookie_pool_files()) or ["cookies.txt"]
+            managers = [
+                CookieManager(path, browser=browser if index == 0 else None) for index, path in enumerate(paths)
+            ]
+        self.identities = [CookieIdentity(manager, rate_per_minute) for manager in managers]
+        self.failure_threshold = failure_threshold
+        self.bench_base = bench_base
+        self.bench_max = bench_max
+        self.over_budget = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.identities)
+
+    @property
+    def has_cookies(self):
+        return any(identity.manager.has_cookies for identity in self.identities)
+
+    @property
+    def healthy(self):
+        now = time.monotonic()
+        with self._lock:
+            return sum(
+                1 for identity in self.identities
+                if identity.manager.has_cookies and identity.benched_for(now) == 0
+            )
+
+    def acquire(self, exclude=()):
+        """
+        Выбирает аккаунт для следующего извлечения и списывает с него один запрос.
+        Поток извлечения не блокируется: если бюджет исчерпан у всех здоровых аккаунтов,
+        вызов идёт без cookies, а частота запросов с каждого аккаунта не превышает его бюджет.
+        Returns:
+            CookieIdentity | None: Аккаунт или None, если здоровых аккаунтов с запасом бюджета нет.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                identity for identity in self.identities
+                if identity.manager.has_cookies and identity.benched_for(now) == 0 and identity not in exclude
+            ]
+            if not candidates:
+                return None
+            for identity in candidates:
+                identity.refill(now)
+            identity = max(candidates, key=lambda candidate: candidate.tokens)
+            if identity.tokens < 1 and identity.rate > 0:
+                self.over_budget += 1
+                logger.debug("Бюджет запросов аккаунтов исчерпан, извлечение без cookies")
+                return None
+            identity.tokens -= 1
+            identity.requests += 1
+            return identity
+
+    def report(self, identity, error=None):
+        """
+        Сообщает результат извлечения с аккаунтом. Только auth и rate_limit говорят о проблеме
+        аккаунта; недоступность конкретного трека на здоровье не влияет.
+        Returns:
+            str | None: Класс ошибки (None при успехе).
+        """
+        kind = classify_error(error) if error is not None else None
+        with self._lock:
+            if kind is None:
+                identity.failures = 0
+                identity.benches = 0
+                return None
+            if kind not in GLOBAL_ERRORS:
+                return kind
+            identity.errors += 1
+            identity.last_kind = kind
+            if identity.benched_for() > 0:
+                # Запрос начался до отстранения: повторно отстранять и удваивать паузу не за что
+                return kind
+            identity.failures += 1
+            if identity.failures >= self.failure_threshold:
+                delay = min(self.bench_base * 2 ** identity.benches, self.bench_max)
+                identity.benched_until = time.monotonic() + delay
+                identity.benches += 1
+                identity.failures = 0
+                identity.benched_version = identity.manager.version if kind == "auth" else None
+                logger.warning(f"Аккаунт {identity.name} отстранён на {delay:.0f} с после ошибок {kind}")
+        return kind
+
+    def status(self):
+        """
+        Returns:
+            list[dict]: Состояние аккаунтов: name, valid, cookies, benched (секунды), requests, errors, last_kind.
+        """
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "name": identity.name,
+                    "valid": identity.manager.valid,
+                    "cookies": identity.manager.has_cookies,
+                    "benched": identity.benched_for(now),
+                    "requests": identity.requests,
+                    "errors": identity.errors,
+                    "last_kind": identity.last_kind,
+                }
+                for identity in self.identities
+            ]
+
+    async def check(self):
+        """
+        Проверяет срок всех файлов (и пересоздаёт первый через браузер, если он устарел).
+        Returns:
+            bool: Есть ли хотя бы один действительный файл.
+        """
+        results = await asyncio.gather(*(identity.manager.check() for identity in self.identities))
+        return any(results)
+
+    async def start(self):
+        await asyncio.gather(*(identity.manager.start() for identity in self.identities))
+        logger.info(f"Аккаунтов в пуле cookies: {len(self.identities)}")
+
+    def stop(self):
+        for identity in self.identities:
+            identity.manager.stop()
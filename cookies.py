@@ -1,18 +1,21 @@
 import browser_cookie3
+import glob
 import logging
 import os
+import sys
 from datetime import datetime, timedelta
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_cookies_file(browser="edge", output_file="cookies.txt"):
+def generate_cookies_file(browser="edge", output_file="cookies.txt", cookie_file=None):
     """
     Извлекает cookies для youtube.com из указанного браузера и сохраняет их в cookies.txt.
     Args:
         browser (str): Название браузера ('chrome', 'firefox', 'edge').
         output_file (str): Путь к файлу для сохранения cookies.
+        cookie_file (str): База cookies конкретного профиля браузера (по умолчанию — профиль по умолчанию).
     Returns:
         bool: True, если cookies успешно сохранены, False в случае ошибки.
     """
@@ -21,11 +24,11 @@ def generate_cookies_file(browser="edge", output_file="cookies.txt"):
         
         # Извлечение cookies
         if browser.lower() == "chrome":
-            cookies = browser_cookie3.chrome(domain_name="youtube.com")
+            cookies = browser_cookie3.chrome(cookie_file=cookie_file, domain_name="youtube.com")
         elif browser.lower() == "firefox":
-            cookies = browser_cookie3.firefox(domain_name="youtube.com")
+            cookies = browser_cookie3.firefox(cookie_file=cookie_file, domain_name="youtube.com")
         elif browser.lower() == "edge":
-            cookies = browser_cookie3.edge(domain_name="youtube.com")
+            cookies = browser_cookie3.edge(cookie_file=cookie_file, domain_name="youtube.com")
         else:
             logger.error(f"Неподдерживаемый браузер: {browser}")
             return False
@@ -90,9 +93,51 @@ def is_cookies_file_valid(file_path="cookies.txt", max_age_days=30):
 
     return True
 
+def pool_file_name(index, directory="."):
+    """
+    Имя файла аккаунта в пуле: cookies.txt для первого, cookies-2.txt, cookies-3.txt и т.д. для остальных.
+    """
+    return os.path.join(directory, "cookies.txt" if index == 0 else f"cookies-{index + 1}.txt")
+
+def cookie_pool_files(directory="."):
+    """
+    Находит файлы пула cookies (cookies.txt и cookies-N.txt).
+    Returns:
+        list[str]: Пути в порядке номеров, cookies.txt первым.
+    """
+    def number(path):
+        stem = os.path.splitext(os.path.basename(path))[0]
+        suffix = stem.partition("-")[2]
+        return int(suffix) if suffix.isdigit() else 1
+
+    files = [pool_file_name(0, directory)] if os.path.exists(pool_file_name(0, directory)) else []
+    extra = [path for path in glob.glob(os.path.join(directory, "cookies-*.txt")) if number(path) > 1]
+    return files + sorted(extra, key=number)
+
+def generate_cookies_pool(browser="edge", profiles=(), directory="."):
+    """
+    Создаёт по файлу cookies на каждый профиль браузера (по аккаунту YouTube на профиль).
+    Args:
+        browser (str): Название браузера.
+        profiles (list[str]): Пути к базам cookies профилей; первый попадёт в cookies.txt.
+        directory (str): Каталог для файлов.
+    Returns:
+        list[str]: Успешно созданные файлы.
+    """
+    created = []
+    for index, profile in enumerate(profiles):
+        output_file = pool_file_name(index, directory)
+        if generate_cookies_file(browser=browser, output_file=output_file, cookie_file=profile):
+            created.append(output_file)
+    return created
+
 if __name__ == "__main__":
-    # Генерация cookies.txt при локальном запуске
-    if generate_cookies_file(browser="edge", output_file="cookies.txt"):
+    # Генерация cookies.txt при локальном запуске; с аргументами — по файлу на каждый профиль браузера:
+    # python cookies.py <база cookies профиля 1> <база cookies профиля 2> ...
+    if len(sys.argv) > 1:
+        created = generate_cookies_pool(browser="edge", profiles=sys.argv[1:])
+        print(f"Создано файлов cookies: {len(created)} из {len(sys.argv) - 1}: {', '.join(created)}")
+    elif generate_cookies_file(browser="edge", output_file="cookies.txt"):
         print("Cookies успешно сгенерированы! Можно использовать deploy_bot.py для загрузки на GitHub.")
     else:
         print("Ошибка генерации cookies. Убедитесь, что вы вошли в YouTube в Edge и браузер не открыт во время выполнения скрипта.")
\ No newline at end of file
@@ -3,7 +3,7 @@ import subprocess
 import logging
 import requests
 from dotenv import load_dotenv
-from cookies import generate_cookies_file
+from cookies import cookie_pool_files, generate_cookies_file
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -39,7 +39,8 @@ def generate_and_upload_cookies():
 
         # Git команды для коммита и пуша
         commands = [
-            ["git", "add", "cookies.txt"],
+            # Вместе с cookies.txt загружаются файлы остальных аккаунтов пула (cookies-N.txt), если они есть
+            ["git", "add"] + cookie_pool_files(),
             ["git", "commit", "-m", "Автоматическое обновление cookies.txt"],
             ["git", "push", "origin", "main"]
         ]
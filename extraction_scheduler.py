@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Приоритеты задач: интерактивные (/play) обслуживаются раньше фоновых (предзагрузка)
+INTERACTIVE = 0
+BACKGROUND = 1
+
+class ExtractionScheduler:
+    """
+    Отдельный пул потоков для extract_info с глобальным ограничением параллелизма.
+    Задачи одного приоритета выбираются по кругу между серверами, поэтому
+    большой плейлист одного сервера не занимает все потоки.
+    Задачу, поставленную с ключом, можно поднять до интерактивной через promote(),
+    пока она ждёт в очереди (например, когда /play присоединяется к фоновой предзагрузке того же трека).
+    Args:
+        max_workers (int): Максимум одновременных извлечений.
+        timeout (float): Таймаут выполнения одного вызова (от запуска в потоке, без ожидания в очереди), в секундах.
+    """
+
+    def __init__(self, max_workers=4, timeout=45):
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="extract")
+        self._queues = {INTERACTIVE: OrderedDict(), BACKGROUND: OrderedDict()}
+        self._running = 0
+        self._keys = {}
+
+    @property
+    def queue_depth(self):
+        return sum(len(jobs) for queue in self._queues.values() for jobs in queue.values())
+
+    @property
+    def running(self):
+        return self._running
+
+    async def run(self, guild_id, func, *args, priority=INTERACTIVE, timeout=None, key=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        job = (future, func, args, timeout or self.timeout, key)
+        self._queues[priority].setdefault(guild_id, deque()).append(job)
+        if key is not None:
+            self._keys[key] = (priority, guild_id, job)
+        self._dispatch()
+        return await future
+
+    def promote(self, key):
+        """
+        Переносит ожидающую фоновую задачу с ключом key в интерактивную очередь её сервера.
+        Returns:
+            bool: Была ли задача перенесена (False, если она уже запущена, завершена или уже интерактивная).
+        """
+        entry = self._keys.get(key)
+        if entry is None or entry[0] == INTERACTIVE:
+            return False
+        priority, guild_id, job = entry
+        jobs = self._queues[priority][guild_id]
+        jobs.remove(job)
+        if not jobs:
+            del self._queues[priority][guild_id]
+        self._queues[INTERACTIVE].setdefault(guild_id, deque()).append(job)
+        self._keys[key] = (INTERACTIVE, guild_id, job)
+        return True
+
+    def _next_job(self):
+        for priority in (INTERACTIVE, BACKGROUND):
+            queue = self._queues[priority]
+            while queue:
+                guild_id, jobs = next(iter(queue.items()))
+                job = jobs.popleft()
+                if jobs:
+                    queue.move_to_end(guild_id)
+                else:
+                    del queue[guild_id]
+                key = job[4]
+                if key is not None and self._keys.get(key, (None, None, None))[2] is job:
+                    del self._keys[key]
+                if not job[0].done():
+                    return job
+        return None
+
+    def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.max_workers:
+            job = self._next_job()
+            if job is None:
+                return
+            future, func, args, timeout, _ = job
+            self._running += 1
+            # Таймаут отсчитывается с запуска: под нагрузкой задача может долго ждать в очереди
+            timer = loop.call_later(timeout, self._expire, future)
+            work = loop.run_in_executor(self._executor, func, *args)
+            work.add_done_callback(lambda done, future=future, timer=timer: self._finish(future, timer, done))
+
+    def _expire(self, future):
+        if not future.done():
+            future.set_exception(asyncio.TimeoutError())
+
+    def _finish(self, future, timer, done):
+        timer.cancel()
+        self._running -= 1
+        if not future.done():
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result(done.result())
+        self._dispatch()
+
+    def shutdown(self):
+        for queue in self._queues.values():
+            for jobs in queue.values():
+                for future, *_ in jobs:
+                    future.cancel()
+            queue.clear()
+        self._keys.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
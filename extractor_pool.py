@@ -0,0 +1,131 @@
+import logging
+import threading
+from yt_dlp import YoutubeDL
+from failures import GLOBAL_ERRORS
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Базовые параметры yt-dlp для всех профилей; полный профиль разрешает только сам трек,
+# даже если в ссылке есть list= (плоский профиль переопределяет noplaylist)
+YDL_OPTIONS = {
+    "format": "bestaudio/best",
+    "noplaylist": True,
+    "quiet": True,
+    "socket_timeout": 15,
+    "retries": 5,
+    "no_warnings": True,
+}
+
+# Дополнительные параметры плоского профиля (плейлисты без разрешения треков)
+YDL_FLAT_OPTIONS = {
+    "noplaylist": False,
+    "extract_flat": True,
+}
+
+class ExtractorPool:
+    """
+    Пул прогретых экземпляров YoutubeDL по профилям (плоский/полный, аккаунт cookies).
+    Безопасен для вызова из пула потоков: каждый экземпляр в один момент
+    используется только одним потоком. Аккаунт для каждого вызова выбирает CookiePool,
+    cookies берутся из памяти, а экземпляры со старой версией cookies аккаунта пересоздаются.
+    Если аккаунт получил auth или rate_limit, вызов повторяется со вторым аккаунтом, а затем без cookies.
+    Прочие ошибки, полученные с аккаунтом, пробрасываются с атрибутом cookie_identity.
+    Args:
+        cookies (CookiePool | None): Пул аккаунтов cookies.
+        max_idle (int): Сколько свободных экземпляров хранить на профиль.
+        factory (callable): Конструктор экстрактора (по умолчанию YoutubeDL).
+    """
+
+    def __init__(self, cookies=None, max_idle=4, factory=YoutubeDL):
+        self.cookies = cookies
+        self.max_idle = max_idle
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.created = 0
+
+    def _close(self, ydl):
+        close = getattr(ydl, "close", None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _options(self, flat):
+        opts = dict(YDL_OPTIONS)
+        if flat:
+            opts.update(YDL_FLAT_OPTIONS)
+        return opts
+
+    def _create(self, flat, identity):
+        ydl = self.factory(self._options(flat))
+        if identity is None:
+            return ydl
+        # Имя аккаунта нужно только для журналов и заглушек в бенчмарке
+        ydl.cookie_identity = identity.name
+        jar = getattr(ydl, "cookiejar", None)
+        if jar is not None:
+            # Cookies копируются из памяти, без cookiefile: файл не читается и не перезаписывается yt-dlp
+            for cookie in identity.manager.cookies():
+                jar.set_cookie(cookie)
+        return ydl
+
+    def acquire(self, flat=False, identity=None):
+        key = (flat, identity.name if identity is not None else None)
+        stamp = identity.manager.version if identity is not None else 0
+        with self._lock:
+            instances = self._idle.get(key)
+            while instances:
+                instance_stamp, ydl = instances.pop()
+                if instance_stamp == stamp:
+                    return key, stamp, ydl
+                self._close(ydl)
+        ydl = self._create(flat, identity)
+        with self._lock:
+            self.created += 1
+        return key, stamp, ydl
+
+    def release(self, key, stamp, ydl):
+        with self._lock:
+            instances = self._idle.setdefault(key, [])
+            if len(instances) >= self.max_idle:
+                self._close(ydl)
+                return
+            instances.append((stamp, ydl))
+
+    def _extract_with(self, identity, url, flat, playlist_items):
+        key, stamp, ydl = self.acquire(flat, identity)
+        # Экземпляр принадлежит только этому потоку, поэтому параметры можно менять на время вызова
+        ydl.params["playlist_items"] = playlist_items
+        try:
+            return ydl.extract_info(url, download=False)
+        finally:
+            ydl.params.pop("playlist_items", None)
+            self.release(key, stamp, ydl)
+
+    def extract_info(self, url, flat=False, playlist_items=None):
+        if self.cookies is None:
+            return self._extract_with(None, url, flat, playlist_items)
+        tried = []
+        while True:
+            # Не больше двух аккаунтов на вызов, последняя попытка — без cookies
+            identity = self.cookies.acquire(exclude=tried) if len(tried) < 2 else None
+            try:
+                info = self._extract_with(identity, url, flat, playlist_items)
+            except Exception as e:
+                if identity is None:
+                    raise
+                kind = self.cookies.report(identity, e)
+                tried.append(identity)
+                if kind not in GLOBAL_ERRORS:
+                    # Ошибку с аккаунтом уже учёл CookiePool; вызывающий код по этой метке её не дублирует
+                    e.cookie_identity = identity.name
+                    raise
+                logger.info(f"Аккаунт {identity.name}: {kind}, повтор {url}")
+                continue
+            if identity is not None:
+                self.cookies.report(identity)
+            return info
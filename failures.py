@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import re
+import time
+from collections import OrderedDict
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Классы ошибок, которые говорят о проблеме со всеми треками сразу, а не с одним URL
+GLOBAL_ERRORS = ("auth", "rate_limit")
+
+# Сколько секунд помнить неудачу по классу ошибки (глобальные ошибки обрабатывает CircuitBreaker)
+NEGATIVE_TTL = {
+    "unavailable": 1800,
+    "restricted": 1800,
+    "region": 1800,
+    "http": 300,
+    "timeout": 60,
+    "other": 120,
+}
+
+# Коды HTTP и «geo» ищутся как отдельные слова: ID видео (буквы, цифры, «-» и «_») могут их содержать
+RATE_LIMIT_PATTERN = re.compile(r"HTTP Error 429|(?<![\w-])429(?![\w-])|too many requests|rate-limited|try again later", re.IGNORECASE)
+REGION_PATTERN = re.compile(r"country|(?<![\w-])geo(?![\w])", re.IGNORECASE)
+NOT_FOUND_PATTERN = re.compile(r"HTTP Error 404|(?<![\w-])404(?![\w-])|unavailable|removed", re.IGNORECASE)
+
+class StreamUnavailableError(Exception):
+    """Поток разрешился, но HEAD-проверка вернула не 200."""
+
+    def __init__(self, status):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+class CircuitOpenError(Exception):
+    """Извлечение приостановлено после серии глобальных ошибок."""
+
+    def __init__(self, retry_in):
+        super().__init__(f"Извлечение приостановлено на {retry_in:.0f} с")
+        self.retry_in = retry_in
+
+def classify_error(error):
+    """
+    Определяет класс ошибки извлечения или проверки потока.
+    Сначала проверяются причины, относящиеся к одному видео (приватное, 18+, только для спонсоров):
+    их сообщения тоже содержат «Sign in», но аккаунт и остальные треки тут ни при чём.
+    Returns:
+        str: auth, rate_limit, unavailable, restricted, region, http, timeout или other.
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, StreamUnavailableError):
+        return "rate_limit" if error.status == 429 else "http"
+    message = str(error)
+    lowered = message.lower()
+    if "private video" in lowered:
+        return "unavailable"
+    if "confirm your age" in lowered or "age-restricted" in lowered or "inappropriate for some users" in lowered:
+        return "restricted"
+    if "members-only" in lowered or "members only" in lowered or "join this channel" in lowered:
+        return "restricted"
+    if "not a bot" in lowered or "cookies are no longer valid" in lowered:
+        return "auth"
+    if RATE_LIMIT_PATTERN.search(message):
+        return "rate_limit"
+    if REGION_PATTERN.search(message):
+        return "region"
+    if NOT_FOUND_PATTERN.search(message):
+        return "unavailable"
+    return "other"
+
+class NegativeCache:
+    """
+    Недавно не сработавшие URL: повторная попытка до истечения срока пропускается без вызова yt-dlp.
+    Срок зависит от класса ошибки (NEGATIVE_TTL), ttl_scale позволяет его масштабировать.
+    """
+
+    def __init__(self, max_size=2048, ttl_scale=1.0):
+        self.max_size = max_size
+        self.ttl_scale = ttl_scale
+        self._entries = OrderedDict()
+
+    def put(self, url, kind, message):
+        ttl = NEGATIVE_TTL.get(kind)
+        if not ttl:
+            return
+        self._entries[url] = (kind, message, time.monotonic() + ttl * self.ttl_scale)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            return None
+        if entry[2] <= time.monotonic():
+            del self._entries[url]
+            return None
+        return entry[0], entry[1]
+
+    def __len__(self):
+        return len(self._entries)
+
+class CircuitBreaker:
+    """
+    Размыкается после threshold глобальных ошибок подряд (auth, rate_limit)
+    и не пропускает извлечение base_delay секунд; каждое следующее размыкание
+    без успешного извлечения между ними удваивает паузу до max_delay.
+    """
+
+    def __init__(self, threshold=3, base_delay=30, max_delay=900):
+        self.threshold = threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.consecutive = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.last_kind = None
+
+    @property
+    def retry_in(self):
+        return max(0.0, self.open_until - time.monotonic())
+
+    @property
+    def is_open(self):
+        return self.retry_in > 0
+
+    def check(self):
+        if self.is_open:
+            raise CircuitOpenError(self.retry_in)
+
+    def record_success(self):
+        self.consecutive = 0
+        self.trips = 0
+
+    def record_failure(self, kind):
+        if kind not in GLOBAL_ERRORS:
+            return
+        self.consecutive += 1
+        self.last_kind = kind
+        if self.consecutive >= self.threshold:
+            delay = min(self.base_delay * 2 ** self.trips, self.max_delay)
+            self.open_until = time.monotonic() + delay
+            self.trips += 1
+            self.consecutive = 0
+            logger.warning(f"Извлечение приостановлено на {delay:.0f} с после ошибок {kind}")
@@ -0,0 +1,191 @@
+import asyncio
+import contextlib
+import logging
+import os
+import time
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+class FFmpegLimitError(Exception):
+    """Новый процесс FFmpeg превысил бы глобальный или серверный лимит."""
+
+class _Child:
+    __slots__ = ("guild_id", "source", "process", "started", "frames", "progress_at", "orphan_since", "ticks", "cpu", "rss")
+
+    def __init__(self, guild_id, source, process):
+        self.guild_id = guild_id
+        self.source = source
+        self.process = process
+        self.started = time.monotonic()
+        self.frames = 0
+        self.progress_at = self.started
+        self.orphan_since = None
+        self.ticks = None
+        self.cpu = 0.0
+        self.rss = 0
+
+def _read_usage(pid):
+    # /proc есть только в Linux; на других системах ресурсы не записываются
+    try:
+        with open(f"/proc/{pid}/stat", "r") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm", "r") as f:
+            resident = int(f.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    # После ")" поля начинаются с третьего: utime и stime — 14-е и 15-е
+    return int(fields[11]) + int(fields[12]), resident * PAGE_SIZE
+
+class FFmpegSupervisor:
+    """
+    Учитывает все процессы FFmpeg воспроизведения: ограничивает их общее число и число на сервер,
+    а загрузки аудиокэша (download()) считает в общем лимите узла,
+    раз в interval секунд записывает CPU и RSS каждого процесса, завершает процессы,
+    которые не принадлежат ни одному плееру дольше orphan_grace секунд или не отдают
+    кадры дольше stall_seconds во время воспроизведения.
+    Args:
+        state (callable): (guild_id, source) -> "playing", "paused", "pending" или None (сирота).
+        max_total (int): Максимум процессов на узел.
+        max_per_guild (int): Максимум процессов на сервер (текущий, заготовленный и перемотка).
+    """
+
+    def __init__(self, state, max_total=64, max_per_guild=3, stall_seconds=20, orphan_grace=10, interval=5):
+        self.state = state
+        self.max_total = max_total
+        self.max_per_guild = max_per_guild
+        self.stall_seconds = stall_seconds
+        self.orphan_grace = orphan_grace
+        self.interval = interval
+        self._children = {}
+        self._task = None
+        self.killed = 0
+        self.downloads = 0
+
+    def __len__(self):
+        return len(self._children)
+
+    def guild_count(self, guild_id):
+        return sum(1 for child in self._children.values() if child.guild_id == guild_id)
+
+    def _reap(self):
+        for pid, child in list(self._children.items()):
+            if child.process.poll() is not None:
+                del self._children[pid]
+
+    def _kill(self, pid, reason):
+        child = self._children.pop(pid, None)
+        if child is None:
+            return
+        self.killed += 1
+        logger.warning(f"Процесс FFmpeg {pid} сервера {child.guild_id} завершён: {reason}")
+        try:
+            child.process.kill()
+        except OSError:
+            pass
+
+    def _kill_orphans(self, guild_id=None):
+        for pid, child in list(self._children.items()):
+            if guild_id is not None and child.guild_id != guild_id:
+                continue
+            if self.state(child.guild_id, child.source) is None:
+                self._kill(pid, "не принадлежит плееру")
+
+    def admit(self, guild_id):
+        """
+        Проверяет, можно ли запустить ещё один процесс для сервера; сначала освобождает место от сирот.
+        Raises:
+            FFmpegLimitError: Лимит исчерпан.
+        """
+        self._reap()
+        if self.guild_count(guild_id) >= self.max_per_guild:
+            self._kill_orphans(guild_id)
+            if self.guild_count(guild_id) >= self.max_per_guild:
+                raise FFmpegLimitError(f"у сервера уже {self.max_per_guild} процессов FFmpeg")
+        if len(self._children) + self.downloads >= self.max_total:
+            self._kill_orphans()
+            if len(self._children) + self.downloads >= self.max_total:
+                raise FFmpegLimitError(f"на узле уже {self.max_total} процессов FFmpeg")
+
+    @contextlib.contextmanager
+    def download(self):
+        """
+        Учитывает процесс загрузки аудиокэша в общем лимите узла на время блока with.
+        Загрузка занимает только свободное место: max_per_guild процессов остаются
+        в запасе для воспроизведения, а сироты ради неё не завершаются.
+        Raises:
+            FFmpegLimitError: Свободного места нет.
+        """
+        self._reap()
+        if len(self._children) + self.downloads >= self.max_total - self.max_per_guild:
+            raise FFmpegLimitError(
+                f"на узле {len(self._children) + self.downloads} из {self.max_total} процессов FFmpeg, остаток — для воспроизведения"
+            )
+        self.downloads += 1
+        try:
+            yield
+        finally:
+            self.downloads -= 1
+
+    def register(self, guild_id, source, process):
+        if process is not None:
+            self._children[process.pid] = _Child(guild_id, source, process)
+
+    def usage(self):
+        """
+        Returns:
+            dict: guild_id -> (суммарный CPU в процентах ядра, суммарный RSS в байтах).
+        """
+        totals = {}
+        for child in self._children.values():
+            cpu, rss = totals.get(child.guild_id, (0.0, 0))
+            totals[child.guild_id] = (cpu + child.cpu, rss + child.rss)
+        return totals
+
+    def _sample_sync(self, pids):
+        return {pid: _read_usage(pid) for pid in pids}
+
+    async def sweep(self):
+        self._reap()
+        samples = await asyncio.to_thread(self._sample_sync, list(self._children))
+        now = time.monotonic()
+        for pid, child in list(self._children.items()):
+            usage = samples.get(pid)
+            if usage is not None:
+                ticks, child.rss = usage
+                if child.ticks is not None:
+                    child.cpu = (ticks - child.ticks) / CLOCK_TICKS / self.interval * 100
+                child.ticks = ticks
+            state = self.state(child.guild_id, child.source)
+            if state is None:
+                child.orphan_since = child.orphan_since or now
+                if now - child.orphan_since > self.orphan_grace:
+                    self._kill(pid, "не принадлежит плееру")
+                continue
+            child.orphan_since = None
+            frames = getattr(child.source, "frames", 0)
+            if state != "playing" or frames != child.frames:
+                child.frames = frames
+                child.progress_at = now
+            elif now - child.progress_at > self.stall_seconds:
+                self._kill(pid, f"нет кадров {now - child.progress_at:.0f} с")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Ошибка проверки процессов FFmpeg: {e}")
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+import requests
+from dotenv import load_dotenv
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger(__name__)
+
+HEALTH_DIR = "health"
+
+def recommended_shard_count(token):
+    """
+    Запрашивает у Discord рекомендуемое число шардов.
+    Args:
+        token (str): Токен бота.
+    Returns:
+        int: Рекомендуемое число шардов (1 при ошибке).
+    """
+    try:
+        response = requests.get(
+            "https://discord.com/api/v10/gateway/bot",
+            headers={"Authorization": f"Bot {token}"},
+            timeout=10,
+        )
+        if response.status_code == 200:
+            return int(response.json().get("shards", 1))
+        logger.error(f"Ошибка запроса /gateway/bot: {response.status_code} - {response.text}")
+    except Exception as e:
+        logger.error(f"Ошибка получения числа шардов: {e}")
+    return 1
+
+def split_shards(shard_count, process_count):
+    """
+    Делит шарды 0..shard_count-1 на process_count непрерывных диапазонов.
+    Returns:
+        list[list[int]]: Список шардов для каждого процесса (пустые диапазоны отбрасываются).
+    """
+    process_count = max(1, min(process_count, shard_count))
+    base, extra = divmod(shard_count, process_count)
+    ranges = []
+    start = 0
+    for index in range(process_count):
+        size = base + (1 if index < extra else 0)
+        ranges.append(list(range(start, start + size)))
+        start += size
+    return ranges
+
+class ShardProcess:
+    """
+    Процесс JamBot.py, обслуживающий диапазон шардов.
+    Вывод процесса пересылается в общий лог с префиксом диапазона.
+    """
+
+    def __init__(self, index, shard_ids, shard_count):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.label = f"shards {shard_ids[0]}-{shard_ids[-1]}"
+        self.health_file = os.path.join(HEALTH_DIR, f"worker-{index}.json")
+        self.process = None
+        self.restarts = 0
+        self.started_at = 0
+
+    def start(self):
+        env = dict(os.environ)
+        env["SHARD_IDS"] = ",".join(str(shard) for shard in self.shard_ids)
+        env["SHARD_COUNT"] = str(self.shard_count)
+        env["HEALTH_FILE"] = self.health_file
+        # У каждого процесса свой журнал сессий: общий файл процессы перезаписывали бы при сжатии
+        journal = os.getenv("SESSION_JOURNAL", "sessions.journal")
+        if journal:
+            root, ext = os.path.splitext(journal)
+            env["SESSION_JOURNAL"] = f"{root}-{self.index}{ext}"
+        # Порт метрик: базовый + номер процесса, иначе второй и следующие процессы не смогут его занять
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port:
+            env["METRICS_PORT"] = str(int(metrics_port) + self.index)
+        env["PYTHONUNBUFFERED"] = "1"
+        self.process = subprocess.Popen(
+            [sys.executable, "JamBot.py"],
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._forward_output, daemon=True).start()
+        logger.info(f"[{self.label}] Запущен процесс {self.process.pid}")
+
+    def _forward_output(self):
+        for line in self.process.stdout:
+            print(f"[{self.label}] {line}", end="", flush=True)
+
+    def read_health(self):
+        try:
+            with open(self.health_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+def main():
+    """
+    Запускает бота в нескольких процессах, по диапазону шардов на процесс.
+    Переменные окружения: SHARD_COUNT (по умолчанию рекомендация Discord),
+    SHARD_PROCESSES (по умолчанию число ядер), HEALTH_INTERVAL (секунды).
+    Процесс N получает METRICS_PORT + N и журнал сессий sessions-N.journal.
+    """
+    load_dotenv()
+    token = os.getenv("DISCORD_TOKEN")
+    if not token:
+        logger.error("DISCORD_TOKEN не найден в .env")
+        sys.exit(1)
+
+    shard_count = int(os.getenv("SHARD_COUNT") or recommended_shard_count(token))
+    process_count = int(os.getenv("SHARD_PROCESSES") or os.cpu_count() or 1)
+    health_interval = float(os.getenv("HEALTH_INTERVAL", "30"))
+    os.makedirs(HEALTH_DIR, exist_ok=True)
+
+    workers = [
+        ShardProcess(index, shard_ids, shard_count)
+        for index, shard_ids in enumerate(split_shards(shard_count, process_count))
+    ]
+    logger.info(f"Шардов: {shard_count}, процессов: {len(workers)}")
+    for worker in workers:
+        worker.start()
+
+    last_report = time.monotonic()
+    try:
+        while True:
+            time.sleep(1)
+            for worker in workers:
+                code = worker.process.poll()
+                if code is None:
+                    continue
+                # Процесс, упавший вскоре после старта, перезапускается с нарастающей задержкой
+                uptime = time.monotonic() - worker.started_at
+                worker.restarts = 0 if uptime > 300 else worker.restarts + 1
+                delay = min(60, 2 ** worker.restarts)
+                logger.error(f"[{worker.label}] Процесс завершился с кодом {code}, перезапуск через {delay} с")
+                time.sleep(delay)
+                worker.start()
+
+            if time.monotonic() - last_report >= health_interval:
+                last_report = time.monotonic()
+                guilds = 0
+                voice = 0
+                for worker in workers:
+                    health = worker.read_health()
+                    if not health or time.time() - health.get("timestamp", 0) > health_interval * 3:
+                        logger.warning(f"[{worker.label}] Нет свежих данных о состоянии")
+                        continue
+                    guilds += health.get("guilds", 0)
+                    voice += health.get("voice_clients", 0)
+                    logger.info(
+                        f"[{worker.label}] серверов: {health.get('guilds')}, голосовых: {health.get('voice_clients')}, "
+                        f"задержка: {health.get('latency_ms')} мс"
+                    )
+                logger.info(f"Всего серверов: {guilds}, голосовых подключений: {voice}")
+    except KeyboardInterrupt:
+        logger.info("Остановка процессов...")
+    finally:
+        for worker in workers:
+            worker.stop()
+
+if __name__ == "__main__":
+    main()
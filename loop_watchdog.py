@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from logging.handlers import RotatingFileHandler
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class LoopWatchdog:
+    """
+    Следит за задержкой цикла событий. Корутина-пульс отмечается каждые interval секунд,
+    а отдельный поток, заметив, что пульса нет дольше threshold, снимает стек потока
+    цикла событий — то есть код, который блокирует цикл прямо сейчас.
+    Args:
+        threshold (float): Порог задержки в секундах.
+        interval (float): Период пульса в секундах.
+        log_file (str | None): Файл для записи зависаний (с ротацией).
+        history (int): Сколько последних зависаний хранить в памяти.
+    """
+
+    def __init__(self, threshold=0.25, interval=0.05, log_file=None, history=50):
+        self.threshold = threshold
+        self.interval = interval
+        self.events = deque(maxlen=history)
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stall_started = None
+        self._stall_stack = None
+        self._file_logger = None
+        if log_file:
+            self._file_logger = logging.getLogger(f"{__name__}.file")
+            self._file_logger.propagate = False
+            if not self._file_logger.handlers:
+                handler = RotatingFileHandler(log_file, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+                self._file_logger.addHandler(handler)
+
+    def start(self):
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._beat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож цикла событий запущен, порог {self.threshold * 1000:.0f} мс")
+
+    def stop(self):
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    async def _beat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            self._last_beat = now
+            if self._stall_started is not None:
+                self._finish_stall(now)
+
+    def _monitor(self):
+        while not self._stop.wait(self.interval):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._stall_stack is not None:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._stall_stack = "".join(traceback.format_stack(frame))
+            self._stall_started = self._last_beat
+
+    def _finish_stall(self, now):
+        duration = now - self._stall_started - self.interval
+        event = {"time": time.time(), "duration": duration, "stack": self._stall_stack}
+        self._stall_started = None
+        self._stall_stack = None
+        self.events.append(event)
+        message = f"Цикл событий заблокирован на {duration * 1000:.0f} мс:\n{event['stack']}"
+        logger.warning(message)
+        if self._file_logger:
+            self._file_logger.warning(message)
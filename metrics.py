@@ -0,0 +1,146 @@
+import logging
+import threading
+import time
+from aiohttp import web
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32)
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus. Потокобезопасна:
+    наблюдения приходят и из цикла событий, и из потока воспроизведения discord.py.
+    """
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start, **self.labels)
+
+class Gauge:
+    """
+    Датчик, значение которого вычисляется при каждом запросе метрик.
+    Args:
+        collect (callable): Возвращает число или список пар (метки, значение).
+    """
+
+    def __init__(self, name, documentation, collect):
+        self.name = name
+        self.documentation = documentation
+        self.collect = collect
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.collect()
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрики {self.name}: {e}")
+            return lines
+        if isinstance(value, (int, float)):
+            lines.append(f"{self.name} {value}")
+        else:
+            for labels, sample in value:
+                lines.append(f"{self.name}{_format_labels(tuple(sorted(labels.items())))} {sample}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, collect):
+        # При перезагрузке модуля команд датчик заменяется, а не дублируется
+        self._metrics = [metric for metric in self._metrics if metric.name != name]
+        metric = Gauge(name, documentation, collect)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+EXTRACT_SECONDS = REGISTRY.histogram("jambot_extract_seconds", "Длительность extract_info (kind=flat|full)")
+HEAD_CHECK_SECONDS = REGISTRY.histogram("jambot_head_check_seconds", "Длительность HEAD-проверки потока")
+FIRST_PACKET_SECONDS = REGISTRY.histogram("jambot_ffmpeg_first_packet_seconds", "От запуска FFmpeg до первого кадра")
+TIME_TO_FIRST_AUDIO_SECONDS = REGISTRY.histogram("jambot_play_first_audio_seconds", "От команды /play до первого кадра")
+TRANSITION_SILENCE_SECONDS = REGISTRY.histogram(
+    "jambot_transition_silence_seconds", "Тишина между треками (mode=gapless|restart)",
+    buckets=(0.02, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8),
+)
+
+async def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Запускает HTTP-сервер с метриками в текстовом формате Prometheus на /metrics.
+    Returns:
+        web.AppRunner: Раннер, который нужно остановить через cleanup().
+    """
+    async def handle(request):
+        return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,116 @@
+import time
+from collections import deque
+
+class Track:
+    """
+    Компактная запись о треке в очереди.
+    Args:
+        url (str): URL страницы трека.
+        title (str): Название (до разрешения — «Неизвестный трек»).
+        duration (float | None): Длительность в секундах, если известна.
+    """
+
+    __slots__ = ("url", "title", "duration", "resolved")
+
+    def __init__(self, url, title="Неизвестный трек", duration=None, resolved=False):
+        self.url = url
+        self.title = title
+        self.duration = duration
+        self.resolved = resolved
+
+    @classmethod
+    def from_entry(cls, entry):
+        return cls(entry["url"], entry.get("title") or "Неизвестный трек", entry.get("duration"))
+
+    def to_entry(self):
+        return {"url": self.url, "title": self.title, "duration": self.duration}
+
+class GuildPlayer:
+    """
+    Всё состояние воспроизведения одного сервера.
+    Очередь — deque, поэтому переход к следующему треку выполняется за O(1).
+    """
+
+    __slots__ = (
+        "guild_id", "voice_client", "voice_channel_id", "text_channel_id", "queue", "current", "current_stream",
+        "loop", "loop_queue", "volume", "playlist_cursor", "playlist_refill", "metadata_tasks", "ended_at",
+        "advance_retry", "reconnecting", "last_active",
+    )
+
+    def __init__(self, guild_id):
+        self.guild_id = guild_id
+        self.voice_client = None
+        self.voice_channel_id = None
+        self.text_channel_id = None
+        self.queue = deque()
+        self.current = None
+        self.current_stream = None
+        self.loop = False
+        self.loop_queue = False
+        self.volume = 1.0
+        self.playlist_cursor = None
+        self.playlist_refill = None
+        self.metadata_tasks = set()
+        self.ended_at = None
+        self.advance_retry = None
+        self.reconnecting = False
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    def is_active(self):
+        vc = self.voice_client
+        return bool(vc and vc.is_connected() and (vc.is_playing() or vc.is_paused()))
+
+    def snapshot(self, position=0):
+        """
+        Возвращает состояние сервера в виде, пригодном для JSON (для журнала сессий).
+        Args:
+            position (float): Позиция текущего трека в секундах.
+        """
+        return {
+            "channel": self.voice_channel_id,
+            "text_channel": self.text_channel_id,
+            "current": self.current.to_entry() if self.current else None,
+            "position": round(position, 1),
+            "queue": [track.to_entry() for track in self.queue],
+            "volume": self.volume,
+            "loop": self.loop,
+            "loop_queue": self.loop_queue,
+            "playlist_cursor": self.playlist_cursor,
+        }
+
+    def restore(self, state):
+        self.voice_channel_id = state.get("channel")
+        self.text_channel_id = state.get("text_channel")
+        self.current = Track.from_entry(state["current"]) if state.get("current") else None
+        self.queue = deque(Track.from_entry(entry) for entry in state.get("queue") or [])
+        self.volume = state.get("volume", 1.0)
+        self.loop = state.get("loop", False)
+        self.loop_queue = state.get("loop_queue", False)
+        self.playlist_cursor = state.get("playlist_cursor")
+
+    def requeue(self, track):
+        """
+        Возвращает сыгранный трек в конец очереди (/loopqueue). Пока плейлист подгружается страницами,
+        трек ждёт в курсоре плейлиста: оставшиеся страницы играются раньше повтора.
+        """
+        if self.playlist_cursor:
+            self.playlist_cursor.setdefault("looped", []).append(track.to_entry())
+        else:
+            self.queue.append(track)
+
+    def finish_playlist(self):
+        # Плейлист подгружен целиком (или подгрузка не удалась): отложенные повторы встают в очередь
+        cursor, self.playlist_cursor = self.playlist_cursor, None
+        if cursor:
+            self.queue.extend(Track.from_entry(entry) for entry in cursor.get("looped") or [])
+
+    def cancel_metadata(self):
+        for task in self.metadata_tasks:
+            task.cancel()
+        self.metadata_tasks.clear()
+
+    def idle_for(self):
+        return time.monotonic() - self.last_active
@@ -0,0 +1,134 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def compact_playlist(info):
+    """
+    Оставляет из результата плоского extract_info только то, что нужно для очереди.
+    Args:
+        info (dict): Результат YoutubeDL.extract_info с ключом entries.
+    Returns:
+        dict: Словарь с ключами title и entries (список {url, title}).
+    """
+    entries = []
+    for entry in info.get("entries") or []:
+        if not entry or not entry.get("url"):
+            continue
+        entries.append({"url": entry["url"], "title": entry.get("title", "Неизвестный трек")})
+    return {"title": info.get("title"), "entries": entries}
+
+class PlaylistStore:
+    """
+    Кэш страниц плейлистов в SQLite с доступом по ключу (url, номер первого трека).
+    Все обращения к диску выполняются в пуле потоков, чтобы не блокировать цикл событий.
+    Страницы удаляются по истечении ttl секунд; при превышении max_entries плейлистов
+    давно не использованные плейлисты удаляются целиком (LRU по последнему доступу к любой странице).
+    """
+
+    def __init__(self, path="playlist_cache.db", ttl=7 * 24 * 3600, max_entries=1000, page_size=50, legacy_json="playlist_cache.json"):
+        self.path = path
+        self.page_size = page_size
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.legacy_json = legacy_json
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Таблица целых плейлистов из прежней версии заменена постраничной
+            self._conn.execute("DROP TABLE IF EXISTS playlists")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS playlist_pages ("
+                "url TEXT NOT NULL, start INTEGER NOT NULL, data TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, PRIMARY KEY (url, start))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS playlist_pages_accessed ON playlist_pages (accessed_at)")
+            self._conn.commit()
+            self._import_legacy()
+        return self._conn
+
+    def _import_legacy(self):
+        if not self.legacy_json or not os.path.exists(self.legacy_json):
+            return
+        try:
+            with open(self.legacy_json, "r") as f:
+                legacy = json.load(f)
+            now = time.time()
+            rows = []
+            playlists = 0
+            for url, info in legacy.items():
+                if not isinstance(info, dict) or "entries" not in info:
+                    continue
+                playlists += 1
+                entries = compact_playlist(info)["entries"]
+                for offset in range(0, max(len(entries), 1), self.page_size):
+                    page = {
+                        "entries": entries[offset:offset + self.page_size],
+                        "last": offset + self.page_size >= len(entries),
+                    }
+                    rows.append((url, offset + 1, json.dumps(page), now, now))
+            self._conn.executemany("INSERT OR IGNORE INTO playlist_pages VALUES (?, ?, ?, ?, ?)", rows)
+            self._conn.commit()
+            os.replace(self.legacy_json, self.legacy_json + ".imported")
+            logger.info(f"Импортировано {playlists} плейлистов из {self.legacy_json}")
+        except Exception as e:
+            logger.error(f"Ошибка импорта {self.legacy_json}: {e}")
+
+    def get_page_sync(self, url, start):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT data, created_at FROM playlist_pages WHERE url = ? AND start = ?", (url, start)
+            ).fetchone()
+            if row is None:
+                return None
+            data, created_at = row
+            now = time.time()
+            if now - created_at > self.ttl:
+                conn.execute("DELETE FROM playlist_pages WHERE url = ? AND start = ?", (url, start))
+                conn.commit()
+                return None
+            conn.execute("UPDATE playlist_pages SET accessed_at = ? WHERE url = ? AND start = ?", (now, url, start))
+            conn.commit()
+        return json.loads(data)
+
+    def put_page_sync(self, url, start, page):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO playlist_pages VALUES (?, ?, ?, ?, ?)",
+                (url, start, json.dumps(page), now, now),
+            )
+            conn.execute("DELETE FROM playlist_pages WHERE created_at < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM playlist_pages WHERE url IN ("
+                "SELECT url FROM playlist_pages GROUP BY url ORDER BY MAX(accessed_at) DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def get_page(self, url, start):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_page_sync, url, start)
+
+    async def put_page(self, url, start, page):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.put_page_sync, url, start, page)
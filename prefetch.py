@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from itertools import islice
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class Prefetcher:
+    """
+    Фоново разрешает ближайшие треки очереди, пока играет текущий.
+    Args:
+        resolve (callable): Корутина (url, guild_id) -> информация о потоке (её результат кэшируется вызывающей стороной).
+        depth (int): Сколько следующих треков очереди разрешать заранее.
+        concurrency (int): Максимум одновременных разрешений на все серверы.
+    """
+
+    def __init__(self, resolve, depth=3, concurrency=4):
+        self.resolve = resolve
+        self.depth = depth
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tasks = {}
+
+    def schedule(self, guild_id, queue):
+        if self.depth <= 0 or not queue:
+            return
+        tasks = self._tasks.setdefault(guild_id, {})
+        for track in islice(queue, self.depth):
+            url = track.url
+            if track.resolved or url in tasks:
+                continue
+            task = asyncio.get_running_loop().create_task(self._prefetch(guild_id, track))
+            tasks[url] = task
+            task.add_done_callback(lambda _, url=url: tasks.pop(url, None))
+
+    async def _prefetch(self, guild_id, track):
+        try:
+            async with self._semaphore:
+                stream = await self.resolve(track.url, guild_id)
+            track.title = stream["title"]
+            track.duration = stream.get("duration")
+            track.resolved = True
+            logger.info(f"Предзагружен трек: {stream['title']}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Не удалось предзагрузить {track.url}: {e}")
+
+    def cancel(self, guild_id):
+        for task in self._tasks.pop(guild_id, {}).values():
+            task.cancel()
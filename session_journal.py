@@ -0,0 +1,115 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SessionJournal:
+    """
+    Журнал состояния плееров серверов только на дозапись (JSON Lines).
+    Записи: {"g": id, "s": снимок} — полное состояние, {"g": id, "p": позиция} — позиция текущего трека,
+    {"g": id, "d": 1} — сервер освобождён. При чтении побеждает последняя запись сервера.
+    Когда записей становится больше compact_after и вдвое больше числа серверов,
+    журнал переписывается одним снимком на сервер (через временный файл и os.replace).
+    Args:
+        path (str): Путь к файлу журнала.
+        compact_after (int): Минимальное число записей до сжатия.
+    """
+
+    def __init__(self, path="sessions.journal", compact_after=10000):
+        self.path = path
+        self.compact_after = compact_after
+        self._states = {}
+        self._pending = []
+        self._records = 0
+        self._lock = threading.Lock()
+
+    def states(self):
+        return dict(self._states)
+
+    def _apply(self, record):
+        guild_id = record["g"]
+        if "s" in record:
+            self._states[guild_id] = record["s"]
+        elif "p" in record:
+            state = self._states.get(guild_id)
+            if state is not None:
+                # Снимки не изменяются на месте: сжатие может сериализовать их в другом потоке
+                self._states[guild_id] = dict(state, position=record["p"])
+        elif "d" in record:
+            self._states.pop(guild_id, None)
+
+    def _read_sync(self):
+        records = []
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Последняя строка могла оборваться при аварийном завершении
+                        logger.warning(f"Пропущена повреждённая запись журнала {self.path}")
+        except FileNotFoundError:
+            pass
+        return records
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        records = await loop.run_in_executor(None, self._read_sync)
+        for record in records:
+            self._apply(record)
+        self._records = len(records)
+        logger.info(f"Журнал сессий прочитан: {len(records)} записей, серверов: {len(self._states)}")
+
+    def _append(self, record):
+        self._apply(record)
+        self._pending.append(record)
+
+    def record(self, guild_id, state):
+        self._append({"g": guild_id, "s": state})
+
+    def record_position(self, guild_id, position):
+        state = self._states.get(guild_id)
+        position = round(position, 1)
+        if state is not None and state.get("position") != position:
+            self._append({"g": guild_id, "p": position})
+
+    def remove(self, guild_id):
+        if guild_id in self._states:
+            self._append({"g": guild_id, "d": 1})
+
+    def _write_sync(self, lines, snapshot):
+        with self._lock:
+            if snapshot is None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+                    f.flush()
+                    os.fsync(f.fileno())
+                return
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for guild_id, state in snapshot.items():
+                    f.write(json.dumps({"g": guild_id, "s": state}, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+
+    async def flush(self):
+        if not self._pending:
+            return
+        lines = [json.dumps(record, ensure_ascii=False) + "\n" for record in self._pending]
+        self._pending = []
+        self._records += len(lines)
+        snapshot = None
+        if self._records > self.compact_after and self._records > 2 * len(self._states):
+            # Снимок берётся в цикле событий вместе с очередью записей, поэтому он включает их все
+            snapshot = dict(self._states)
+            self._records = len(snapshot)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._write_sync, lines, snapshot)
+        if snapshot is not None:
+            logger.info(f"Журнал сессий сжат до {len(snapshot)} записей")
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class SingleFlight:
+    """
+    Объединяет одновременные вызовы с одинаковым ключом: работа выполняется один раз,
+    остальные вызывающие ждут тот же результат (или ту же ошибку).
+    Отмена одного ожидающего не отменяет общую задачу для остальных.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.coalesced = 0
+
+    async def run(self, key, factory):
+        task = self._flights.get(key)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(factory())
+            self._flights[key] = task
+            task.add_done_callback(lambda _: self._flights.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._flights)
@@ -0,0 +1,140 @@
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, parse_qs
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def parse_stream_expiry(stream_url):
+    """
+    Извлекает время истечения ссылки googlevideo из параметра expire=.
+    Args:
+        stream_url (str): Прямая ссылка на поток.
+    Returns:
+        float | None: Unix-время истечения или None, если параметр не найден.
+    """
+    try:
+        parsed = urlparse(stream_url)
+        values = parse_qs(parsed.query).get("expire")
+        if values:
+            return float(values[0])
+        # Манифесты googlevideo хранят параметры в пути: .../expire/1700000000/...
+        parts = parsed.path.split("/")
+        if "expire" in parts:
+            index = parts.index("expire")
+            if index + 1 < len(parts):
+                return float(parts[index + 1])
+    except (ValueError, TypeError):
+        pass
+    return None
+
+def stream_info_from(info):
+    """
+    Формирует компактную запись о потоке из результата extract_info.
+    Args:
+        info (dict): Результат YoutubeDL.extract_info для одного трека.
+    Returns:
+        dict: Словарь с ключами url, title, duration, acodec, headers.
+    """
+    return {
+        "url": info["url"],
+        "title": info.get("title", "Неизвестный трек"),
+        "duration": info.get("duration"),
+        "acodec": info.get("acodec"),
+        "headers": dict(info.get("http_headers") or {}),
+    }
+
+class StreamCache:
+    """
+    LRU-кэш разрешённых ссылок: URL страницы -> информация о потоке.
+    Записи истекают по параметру expire= ссылки googlevideo
+    (с запасом safety_margin секунд) или через default_ttl, если его нет.
+    """
+
+    def __init__(self, max_size=512, default_ttl=1800, safety_margin=120):
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.safety_margin = safety_margin
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, page_url):
+        return self.get(page_url, count=False) is not None
+
+    def get(self, page_url, count=True):
+        entry = self._entries.get(page_url)
+        if entry is None:
+            if count:
+                self.misses += 1
+            return None
+        expires_at, stream = entry
+        if expires_at <= time.time():
+            del self._entries[page_url]
+            if count:
+                self.misses += 1
+            return None
+        self._entries.move_to_end(page_url)
+        if count:
+            self.hits += 1
+        return stream
+
+    def put(self, page_url, stream):
+        expiry = parse_stream_expiry(stream["url"])
+        if expiry is None:
+            expires_at = time.time() + self.default_ttl
+        else:
+            expires_at = expiry - self.safety_margin
+        if expires_at <= time.time():
+            logger.debug(f"Ссылка уже истекает, не кэшируется: {page_url}")
+            return
+        self._entries[page_url] = (expires_at, stream)
+        self._entries.move_to_end(page_url)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, page_url):
+        self._entries.pop(page_url, None)
+
+    def clear(self):
+        self._entries.clear()
+
+class ProbeCache:
+    """
+    Короткоживущий кэш результатов HEAD-проверки: прямая ссылка на поток -> HTTP-статус.
+    Успешный статус хранится ttl секунд, неуспешный — failure_ttl.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, failure_ttl=10):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, stream_url):
+        entry = self._entries.get(stream_url)
+        if entry is None:
+            return None
+        expires_at, status = entry
+        if expires_at <= time.monotonic():
+            del self._entries[stream_url]
+            return None
+        return status
+
+    def put(self, stream_url, status):
+        ttl = self.ttl if status == 200 else self.failure_ttl
+        self._entries[stream_url] = (time.monotonic() + ttl, status)
+        self._entries.move_to_end(stream_url)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, stream_url):
+        self._entries.pop(stream_url, None)
@@ -0,0 +1,189 @@
+import asyncio
+import bisect
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urls import video_id
+
+# Настройка логирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"\w+")
+
+def tokenize(text):
+    """
+    Разбивает текст на слова в нижнем регистре (буквы и цифры любого алфавита).
+    Args:
+        text (str): Название или запрос.
+    Returns:
+        list[str]: Список токенов.
+    """
+    return TOKEN_RE.findall((text or "").lower())
+
+class _GuildIndex:
+    __slots__ = ("entries", "postings", "sorted_tokens")
+
+    def __init__(self):
+        # url -> [title, uses, last_used]; порядок — от давно использованных к недавним
+        self.entries = OrderedDict()
+        self.postings = {}
+        self.sorted_tokens = None
+
+    def tokens_of(self, url, title):
+        tokens = set(tokenize(title))
+        vid = video_id(url)
+        if vid:
+            tokens.add(vid.lower())
+        return tokens
+
+    def add_tokens(self, url, title):
+        for token in self.tokens_of(url, title):
+            self.postings.setdefault(token, set()).add(url)
+        self.sorted_tokens = None
+
+    def remove_tokens(self, url, title):
+        for token in self.tokens_of(url, title):
+            urls = self.postings.get(token)
+            if urls is not None:
+                urls.discard(url)
+                if not urls:
+                    del self.postings[token]
+        self.sorted_tokens = None
+
+    def prefix_matches(self, prefix):
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.postings)
+        matches = set()
+        index = bisect.bisect_left(self.sorted_tokens, prefix)
+        while index < len(self.sorted_tokens) and self.sorted_tokens[index].startswith(prefix):
+            matches |= self.postings[self.sorted_tokens[index]]
+            index += 1
+        return matches
+
+class TrackIndex:
+    """
+    Индекс уже разрешённых треков по серверам для автодополнения /play и /queue.
+    Поиск идёт только по памяти (префиксы слов названия и ID видео), поэтому
+    отвечает за микросекунды и не вызывает yt-dlp. Изменения сбрасываются в SQLite
+    пачками через flush() в пуле потоков.
+    Args:
+        path (str): Путь к файлу SQLite.
+        max_per_guild (int): Максимум треков на сервер (вытесняются давно использованные).
+    """
+
+    def __init__(self, path="track_index.db", max_per_guild=500):
+        self.path = path
+        self.max_per_guild = max_per_guild
+        self._guilds = {}
+        self._dirty = set()
+        self._deleted = set()
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "guild_id INTEGER NOT NULL, url TEXT NOT NULL, title TEXT NOT NULL, "
+                "uses INTEGER NOT NULL, last_used REAL NOT NULL, PRIMARY KEY (guild_id, url))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _load_sync(self):
+        with self._lock:
+            return self._connect().execute(
+                "SELECT guild_id, url, title, uses, last_used FROM tracks ORDER BY last_used"
+            ).fetchall()
+
+    async def load(self):
+        loop = asyncio.get_running_loop()
+        rows = await loop.run_in_executor(None, self._load_sync)
+        for guild_id, url, title, uses, last_used in rows:
+            index = self._guilds.setdefault(guild_id, _GuildIndex())
+            index.entries[url] = [title, uses, last_used]
+            index.add_tokens(url, title)
+        logger.info(f"Индекс треков загружен: {len(rows)} записей, серверов: {len(self._guilds)}")
+
+    def add(self, guild_id, url, title):
+        if not title or title == "Неизвестный трек":
+            return
+        index = self._guilds.setdefault(guild_id, _GuildIndex())
+        entry = index.entries.get(url)
+        if entry is None:
+            index.entries[url] = [title, 1, time.time()]
+            index.add_tokens(url, title)
+        else:
+            if entry[0] != title:
+                index.remove_tokens(url, entry[0])
+                index.add_tokens(url, title)
+                entry[0] = title
+            entry[1] += 1
+            entry[2] = time.time()
+            index.entries.move_to_end(url)
+        self._dirty.add((guild_id, url))
+        self._deleted.discard((guild_id, url))
+        while len(index.entries) > self.max_per_guild:
+            old_url, (old_title, _, _) = index.entries.popitem(last=False)
+            index.remove_tokens(old_url, old_title)
+            self._dirty.discard((guild_id, old_url))
+            self._deleted.add((guild_id, old_url))
+
+    def search(self, guild_id, query, limit=25):
+        """
+        Возвращает до limit треков сервера, у которых каждое слово запроса — префикс слова названия.
+        Пустой запрос возвращает недавние треки; запрос-ссылка сравнивается с началом URL.
+        Returns:
+            list[tuple[str, str]]: Пары (название, url), самые частые и недавние первыми.
+        """
+        index = self._guilds.get(guild_id)
+        if index is None:
+            return []
+        query = (query or "").strip()
+        if "://" in query:
+            candidates = [url for url in index.entries if url.startswith(query)]
+        else:
+            tokens = tokenize(query)
+            if not tokens:
+                recent = list(reversed(index.entries.items()))[:limit]
+                return [(entry[0], url) for url, entry in recent]
+            candidates = None
+            for token in sorted(set(tokens), key=len, reverse=True):
+                matches = index.prefix_matches(token)
+                candidates = matches if candidates is None else candidates & matches
+                if not candidates:
+                    return []
+        ranked = sorted(candidates, key=lambda url: (index.entries[url][1], index.entries[url][2]), reverse=True)
+        return [(index.entries[url][0], url) for url in ranked[:limit]]
+
+    def _flush_sync(self, rows, deleted):
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?)", rows)
+            conn.executemany("DELETE FROM tracks WHERE guild_id = ? AND url = ?", deleted)
+            conn.commit()
+
+    async def flush(self):
+        if not self._dirty and not self._deleted:
+            return
+        rows = []
+        for guild_id, url in self._dirty:
+            entry = self._guilds[guild_id].entries[url]
+            rows.append((guild_id, url, *entry))
+        deleted = list(self._deleted)
+        self._dirty = set()
+        self._deleted = set()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._flush_sync, rows, deleted)
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
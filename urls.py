@@ -0,0 +1,66 @@
+from urllib.parse import urlparse, parse_qs, parse_qsl, urlencode, urlunparse
+
+YOUTUBE_HOSTS = ("youtube.com", "www.youtube.com", "m.youtube.com", "music.youtube.com")
+
+# Параметры, которые не влияют на содержимое и только мешают кэшам
+TRACKING_PARAMS = ("si", "feature", "pp", "ab_channel", "fbclid", "gclid", "igshid")
+
+def video_id(url):
+    """
+    Возвращает ID видео YouTube из URL страницы.
+    Поддерживаются watch?v=, youtu.be/, /shorts/ и /embed/.
+    Args:
+        url (str): URL страницы трека.
+    Returns:
+        str | None: ID видео или None, если URL не распознан.
+    """
+    try:
+        parsed = urlparse(url.strip())
+    except (AttributeError, ValueError):
+        return None
+    host = (parsed.hostname or "").lower()
+    if host == "youtu.be":
+        candidate = parsed.path.lstrip("/").split("/")[0]
+        return candidate or None
+    if host in YOUTUBE_HOSTS:
+        if parsed.path == "/watch":
+            values = parse_qs(parsed.query).get("v")
+            return values[0] if values else None
+        parts = parsed.path.strip("/").split("/")
+        if len(parts) >= 2 and parts[0] in ("shorts", "embed", "live", "v"):
+            return parts[1]
+    return None
+
+def normalize_url(url):
+    """
+    Приводит URL к каноническому виду, чтобы разные ссылки на один трек совпадали в кэшах.
+    Ссылки на видео YouTube (youtu.be, shorts, watch?v=) превращаются в https://www.youtube.com/watch?v=ID
+    (с list=, если он был), плейлисты — в https://www.youtube.com/playlist?list=ID.
+    У прочих ссылок удаляются метки отслеживания (utm_*, si, fbclid и т.п.) и фрагмент.
+    Args:
+        url (str): URL от пользователя.
+    Returns:
+        str: Канонический URL (исходная строка без пробелов, если разобрать не удалось).
+    """
+    url = url.strip()
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return url
+    if not parsed.scheme or not parsed.netloc:
+        return url
+    host = (parsed.hostname or "").lower()
+    query = parse_qs(parsed.query)
+    vid = video_id(url)
+    if vid:
+        canonical = f"https://www.youtube.com/watch?v={vid}"
+        if query.get("list"):
+            canonical += f"&list={query['list'][0]}"
+        return canonical
+    if host in YOUTUBE_HOSTS and parsed.path == "/playlist" and query.get("list"):
+        return f"https://www.youtube.com/playlist?list={query['list'][0]}"
+    params = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key not in TRACKING_PARAMS and not key.startswith("utm_")
+    ]
+    return urlunparse((parsed.scheme.lower(), parsed.netloc.lower(), parsed.path, parsed.params, urlencode(params), ""))